@@ -23,12 +23,16 @@
         'security/purchase_request_groups.xml',
         'security/ir.model.access.csv',
         'data/ir_sequence_data.xml',
+        'data/ir_cron_data.xml',
         'views/project_stage_views.xml',
         'views/project_element_views.xml',
         'views/project_structure_views.xml',
         'views/project_menu_views.xml',  # Must be loaded before master_data_views.xml
         'views/master_data_views.xml',
         'views/boq_summary_views.xml',
+        'views/boq_variance_report_views.xml',
+        'views/h_jubran_boq_import_views.xml',
+        'views/perf_sample_views.xml',
         
         'views/project_views.xml',
         
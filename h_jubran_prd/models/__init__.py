@@ -11,4 +11,7 @@ from . import purchase_request_models
 from . import master_data_models
 from . import sale_order_extends_models
 from . import boq_summary_models
+from . import boq_actual_models
+from . import boq_variance_report_models
+from . import perf_sample_models
 from . import petty_cash_models
@@ -0,0 +1,351 @@
+import logging
+from collections import defaultdict
+
+from odoo import fields, models, api, tools, _
+from odoo.exceptions import UserError
+from odoo.tools import float_is_zero
+
+_logger = logging.getLogger(__name__)
+
+# Sources whose entries are open commitments: they stand for the part of the
+# document not billed yet, so a bill replaces them instead of adding to them.
+# They count in the BOQ actuals and also make the project committed cost.
+_COMMITMENT_SOURCES = ('purchase.order',)
+
+
+class HJubranBoqActualEntry(models.Model):
+    _name = 'h_jubran.boq.actual.entry'
+    _description = 'BOQ Actual Cost Entry'
+    _order = 'id'
+
+    project_id = fields.Many2one(
+        'h_jubran.project',
+        string='Project',
+        required=True,
+        readonly=True,
+        ondelete='restrict'
+    )
+    subcategory_id = fields.Many2one(
+        'h_jubran.master.subcategory',
+        string='Sub-Category',
+        required=True,
+        readonly=True,
+        ondelete='restrict'
+    )
+    source_model = fields.Char(string='Source Model', required=True, readonly=True)
+    source_id = fields.Many2oneReference(
+        string='Source',
+        model_field='source_model',
+        required=True,
+        readonly=True
+    )
+    quantity = fields.Float(
+        string='Quantity',
+        digits=(16, 2),
+        readonly=True,
+        help="Signed change of the actual quantity posted by the source document."
+    )
+    amount = fields.Monetary(
+        string='Amount',
+        currency_field='currency_id',
+        readonly=True,
+        help="Signed change of the actual amount posted by the source document."
+    )
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Currency',
+        readonly=True,
+        default=lambda self: self.env.company.currency_id.id
+    )
+
+    def init(self):
+        tools.create_index(
+            self.env.cr, 'h_jubran_boq_actual_entry_key_index',
+            self._table, ['project_id', 'subcategory_id'],
+        )
+        tools.create_index(
+            self.env.cr, 'h_jubran_boq_actual_entry_source_index',
+            self._table, ['source_model', 'source_id'],
+        )
+        # Seed once every model of the module has its columns
+        self.pool.post_init(self._seed_opening_entries)
+
+    def _seed_opening_entries(self):
+        """One-time opening entries for the documents posted before the ledger
+
+        Each confirmed purchase order, posted vendor bill and petty cash
+        breakdown with a journal entry gets one entry per (project,
+        sub-category), with the same rules as their ``_post_boq_actual_entries``,
+        so that cancelling them later reverses what they really stand for.
+        The BOQ line actuals and project costs are then reconciled with the
+        ledger (see ``_cron_reconcile_boq_actuals``). Runs in the
+        transaction that creates the ledger, and never once it has entries.
+        """
+        cr = self.env.cr
+        cr.execute(f"SELECT 1 FROM {self._table} LIMIT 1")
+        if cr.fetchone():
+            return
+        params = {'uid': self.env.uid, 'currency_id': self.env.company.currency_id.id}
+        cr.execute(f"""
+            INSERT INTO {self._table} (
+                project_id, subcategory_id, source_model, source_id, quantity, amount,
+                currency_id, create_uid, create_date, write_uid, write_date
+            )
+            SELECT project_id, subcategory_id, source_model, source_id, SUM(quantity), SUM(amount),
+                   %(currency_id)s, %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM (
+                    -- The part of the PO lines not billed yet, at the PO unit price;
+                    -- manual lines without a subtotal use their unit price
+                    SELECT o.project_id, pol.subcategory_id, 'purchase.order' AS source_model, o.id AS source_id,
+                           GREATEST(COALESCE(pol.product_qty, 0.0) - COALESCE(billed.quantity, 0.0), 0.0) AS quantity,
+                           GREATEST(COALESCE(pol.product_qty, 0.0) - COALESCE(billed.quantity, 0.0), 0.0)
+                           * CASE WHEN COALESCE(pol.price_subtotal, 0.0) != 0.0 AND COALESCE(pol.product_qty, 0.0) != 0.0
+                                  THEN pol.price_subtotal / pol.product_qty
+                                  ELSE COALESCE(pol.price_unit, 0.0) END AS amount
+                      FROM purchase_order_line pol
+                      JOIN purchase_order o ON o.id = pol.order_id
+                 LEFT JOIN (
+                            SELECT aml.purchase_line_id, SUM(aml.quantity) AS quantity
+                              FROM account_move_line aml
+                              JOIN account_move m ON m.id = aml.move_id
+                             WHERE m.state = 'posted'
+                               AND m.move_type = 'in_invoice'
+                               AND aml.purchase_line_id IS NOT NULL
+                          GROUP BY aml.purchase_line_id
+                           ) billed ON billed.purchase_line_id = pol.id
+                     WHERE o.state IN ('purchase', 'done')
+                       AND o.project_id IS NOT NULL
+                       AND pol.subcategory_id IS NOT NULL
+                    UNION ALL
+                    SELECT m.project_id, aml.subcategory_id, 'account.move', m.id,
+                           COALESCE(aml.quantity, 0.0),
+                           CASE WHEN COALESCE(aml.price_subtotal, 0.0) != 0.0 THEN aml.price_subtotal
+                                ELSE COALESCE(aml.quantity, 0.0) * COALESCE(aml.price_unit, 0.0) END
+                      FROM account_move_line aml
+                      JOIN account_move m ON m.id = aml.move_id
+                     WHERE m.state = 'posted'
+                       AND m.move_type = 'in_invoice'
+                       AND m.project_id IS NOT NULL
+                       AND aml.subcategory_id IS NOT NULL
+                       AND (aml.display_type = 'product' OR aml.display_type IS NULL)
+                    UNION ALL
+                    SELECT pc.project_id, b.subcategory_id, 'h_jubran.petty.cash.breakdown', b.id,
+                           COALESCE(b.quantity, 0.0), COALESCE(b.amount, 0.0)
+                      FROM h_jubran_petty_cash_breakdown b
+                      JOIN h_jubran_petty_cash pc ON pc.id = b.petty_cash_id
+                     WHERE b.move_id IS NOT NULL
+                       AND b.subcategory_id IS NOT NULL
+                       AND pc.project_id IS NOT NULL
+                   ) sources
+          GROUP BY project_id, subcategory_id, source_model, source_id
+            HAVING ROUND(SUM(quantity)::numeric, 2) != 0 OR ROUND(SUM(amount)::numeric, 2) != 0
+        """, params)
+        if not cr.rowcount:
+            return
+        _logger.info("BOQ actuals ledger seeded with %d opening entries", cr.rowcount)
+        self._cron_reconcile_boq_actuals()
+
+    def write(self, vals):
+        raise UserError(_("BOQ actual entries cannot be modified, post a correcting entry instead."))
+
+    def unlink(self):
+        raise UserError(_("BOQ actual entries cannot be deleted, post a correcting entry instead."))
+
+    @api.model
+    def _sync_source(self, source_model, desired):
+        """Post the deltas that bring the sources' net entries to ``desired``.
+
+        ``desired`` maps each source id to ``{(project_id, subcategory_id):
+        (quantity, amount)}``, the actuals the source document currently
+        stands for; an empty dict reverses everything the source posted
+        (cancel, reset to draft, deletion). The net already posted is read
+        with one grouped query, only non-zero differences are appended and
+        the BOQ line actuals and project costs are moved by the same deltas
+        in the same transaction. Returns the number of entries posted.
+        """
+        if not desired:
+            return 0
+        posted = defaultdict(dict)
+        for source_id, project, subcategory, quantity, amount in self._read_group(
+            [('source_model', '=', source_model), ('source_id', 'in', list(desired))],
+            ['source_id', 'project_id', 'subcategory_id'],
+            ['quantity:sum', 'amount:sum'],
+        ):
+            posted[source_id][(project.id, subcategory.id)] = (quantity, amount)
+
+        vals_list = []
+        deltas = defaultdict(lambda: [0.0, 0.0])
+        for source_id, wanted in desired.items():
+            for key in set(wanted) | set(posted[source_id]):
+                quantity, amount = wanted.get(key, (0.0, 0.0))
+                posted_quantity, posted_amount = posted[source_id].get(key, (0.0, 0.0))
+                delta_quantity = quantity - posted_quantity
+                delta_amount = amount - posted_amount
+                if float_is_zero(delta_quantity, precision_digits=2) and float_is_zero(delta_amount, precision_digits=2):
+                    continue
+                vals_list.append({
+                    'project_id': key[0],
+                    'subcategory_id': key[1],
+                    'source_model': source_model,
+                    'source_id': source_id,
+                    'quantity': delta_quantity,
+                    'amount': delta_amount,
+                })
+                deltas[key][0] += delta_quantity
+                deltas[key][1] += delta_amount
+        if vals_list:
+            self.create(vals_list)
+            self._apply_deltas(source_model, deltas)
+        return len(vals_list)
+
+    @api.model
+    def _get_boq_lines(self, keys):
+        """Return the BOQ lines of the (project, sub-category) keys, per key"""
+        lines = self.env['h_jubran.boq.summary.line'].search([
+            ('summary_id.project_id', 'in', list({project_id for project_id, _subcategory_id in keys})),
+            ('subcategory_id', 'in', list({subcategory_id for _project_id, subcategory_id in keys})),
+        ])
+        boq_lines = defaultdict(lambda: self.env['h_jubran.boq.summary.line'])
+        for line in lines:
+            key = (line.summary_id.project_id.id, line.subcategory_id.id)
+            if key in keys:
+                boq_lines[key] |= line
+        return boq_lines
+
+    @api.model
+    def _actual_values(self, quantity, amount):
+        return {
+            'actual_quantity': quantity,
+            # Weighted average rate over everything posted for the key
+            'actual_rate': amount / quantity if quantity > 0 else 0.0,
+            'actual_amount': amount,
+        }
+
+    @api.model
+    def _apply_totals(self, keys):
+        """Set the actuals of the BOQ lines of ``keys`` to their ledger totals
+
+        Used by the reconciliation only: the totals are summed from the whole
+        ledger, so the lines are exact whatever was applied before. Lines
+        of a key share the same values and are written together; only the
+        keys that differ are written. Returns the number of lines written.
+        """
+        if not keys:
+            return 0
+        totals = {}
+        for project, subcategory, quantity, amount in self._read_group(
+            [
+                ('project_id', 'in', list({project_id for project_id, _subcategory_id in keys})),
+                ('subcategory_id', 'in', list({subcategory_id for _project_id, subcategory_id in keys})),
+            ],
+            ['project_id', 'subcategory_id'], ['quantity:sum', 'amount:sum'],
+        ):
+            totals[(project.id, subcategory.id)] = (quantity, amount)
+        written = 0
+        for key, lines in self._get_boq_lines(keys).items():
+            quantity, amount = totals.get(key, (0.0, 0.0))
+            stale = lines.filtered(lambda line: (
+                not float_is_zero(line.actual_quantity - quantity, precision_digits=2)
+                or (line.currency_id or self.env.company.currency_id).compare_amounts(line.actual_amount, amount)
+            ))
+            if stale:
+                stale.write(self._actual_values(quantity, amount))
+                written += len(stale)
+        return written
+
+    @api.model
+    def _apply_deltas(self, source_model, deltas):
+        """Move the BOQ line actuals and project costs by ``deltas``
+
+        ``deltas`` maps ``(project_id, subcategory_id)`` keys to the
+        (quantity, amount) change posted by ``source_model``. Lines are moved
+        by atomic SQL increments in key order, so the new totals are computed
+        by the database from the row values and no update can be lost; the
+        ledger is never re-summed here (see ``_cron_reconcile_boq_actuals``).
+        Commitments also move the committed cost of their projects.
+        """
+        project_amounts = defaultdict(float)
+        for (project_id, _subcategory_id), (_quantity, amount) in deltas.items():
+            project_amounts[project_id] += amount
+        cost_fields = ['actual_cost']
+        if source_model in _COMMITMENT_SOURCES:
+            cost_fields.append('committed_cost')
+        projects = self.env['h_jubran.project'].browse(sorted(project_amounts))
+        projects.flush_recordset(cost_fields)
+        assignments = ', '.join(f"{fname} = COALESCE({fname}, 0) + %(amount)s" for fname in cost_fields)
+        for project_id in sorted(project_amounts):
+            self.env.cr.execute(
+                f"UPDATE h_jubran_project SET {assignments} WHERE id = %(project_id)s",
+                {'amount': project_amounts[project_id], 'project_id': project_id}
+            )
+        projects.invalidate_recordset(cost_fields)
+        projects.modified(cost_fields)
+
+        line_model = self.env['h_jubran.boq.summary.line']
+        line_model.flush_model(['summary_id', 'subcategory_id', 'actual_quantity', 'actual_rate', 'actual_amount'])
+        line_ids = []
+        for project_id, subcategory_id in sorted(deltas):
+            quantity, amount = deltas[(project_id, subcategory_id)]
+            self.env.cr.execute("""
+                UPDATE h_jubran_boq_summary_line l
+                   SET actual_quantity = COALESCE(l.actual_quantity, 0) + %(quantity)s,
+                       actual_amount = COALESCE(l.actual_amount, 0) + %(amount)s,
+                       -- Weighted average rate over everything posted for the key
+                       actual_rate = CASE
+                           WHEN COALESCE(l.actual_quantity, 0) + %(quantity)s > 0
+                           THEN (COALESCE(l.actual_amount, 0) + %(amount)s)
+                                / (COALESCE(l.actual_quantity, 0) + %(quantity)s)
+                           ELSE 0 END,
+                       write_uid = %(uid)s,
+                       write_date = NOW() AT TIME ZONE 'UTC'
+                  FROM h_jubran_boq_summary s
+                 WHERE s.id = l.summary_id
+                   AND s.project_id = %(project_id)s
+                   AND l.subcategory_id = %(subcategory_id)s
+             RETURNING l.id
+            """, {
+                'quantity': quantity,
+                'amount': amount,
+                'uid': self.env.uid,
+                'project_id': project_id,
+                'subcategory_id': subcategory_id,
+            })
+            line_ids.extend(row[0] for row in self.env.cr.fetchall())
+        line_model.browse(line_ids)._actuals_changed()
+
+    @api.model
+    def _cron_reconcile_boq_actuals(self):
+        """Rebuild the BOQ line actuals and project costs from the ledger totals
+
+        The audit counterpart of ``_apply_deltas``: every total is summed
+        again from the whole ledger and only the lines and projects that
+        differ are written.
+        """
+        lines = self.env['h_jubran.boq.summary.line'].search([
+            ('subcategory_id', '!=', False),
+            '|', ('actual_quantity', '!=', 0), ('actual_amount', '!=', 0),
+        ])
+        keys = {(line.summary_id.project_id.id, line.subcategory_id.id) for line in lines}
+        for project, subcategory in self._read_group([], ['project_id', 'subcategory_id']):
+            keys.add((project.id, subcategory.id))
+        fixed = self._apply_totals(keys)
+
+        costs = defaultdict(lambda: {'committed_cost': 0.0, 'actual_cost': 0.0})
+        for project, source_model, amount in self._read_group(
+            [], ['project_id', 'source_model'], ['amount:sum'],
+        ):
+            costs[project]['actual_cost'] += amount
+            if source_model in _COMMITMENT_SOURCES:
+                costs[project]['committed_cost'] += amount
+        projects = self.env['h_jubran.project'].search([
+            '|', ('committed_cost', '!=', 0), ('actual_cost', '!=', 0),
+        ]) | self.env['h_jubran.project'].concat(*costs)
+        for project in projects:
+            currency = project.currency_id or self.env.company.currency_id
+            values = costs[project]
+            if any(currency.compare_amounts(project[fname], values[fname]) for fname in values):
+                project.write(values)
+                fixed += 1
+        if fixed:
+            _logger.warning("BOQ actuals reconcile: %d line(s) or project(s) differed from the ledger and were rebuilt", fixed)
+        return fixed
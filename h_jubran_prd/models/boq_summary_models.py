@@ -1,5 +1,40 @@
-from odoo import fields, models, api, _
-from odoo.exceptions import ValidationError
+import logging
+from collections import defaultdict
+
+from odoo import fields, models, api, tools, _
+from odoo.exceptions import UserError, ValidationError
+
+_logger = logging.getLogger(__name__)
+
+
+# Line values rolled up on the category tree nodes
+_AMOUNT_FIELDS = ('quantity', 'actual_quantity', 'rate', 'actual_rate', 'amount', 'actual_amount')
+
+
+# Line fields the cached BOQ rate lookup depends on (sequence decides the first match)
+_RATE_FIELDS = {'rate', 'subcategory_id', 'category_id', 'summary_id', 'sequence'}
+
+# Cursor cache key of the projects whose BOQ rates changed in the transaction
+_BOQ_RATES_CACHE_KEY = 'h_jubran_boq_rates'
+
+
+def _normalize_scope(scope):
+    """Return the scope label used for grouping (stripped, original case)."""
+    return str(scope).strip() if scope else ''
+
+
+def _boq_rates_changed(cr):
+    """Return the set of projects whose BOQ rates changed in this transaction
+
+    The set lives in the cursor cache and is dropped when the transaction
+    commits or rolls back, so it never outlives the changes it tracks.
+    """
+    changed = cr.cache.get(_BOQ_RATES_CACHE_KEY)
+    if changed is None:
+        changed = cr.cache[_BOQ_RATES_CACHE_KEY] = set()
+        cr.postcommit.add(lambda: cr.cache.pop(_BOQ_RATES_CACHE_KEY, None))
+        cr.postrollback.add(lambda: cr.cache.pop(_BOQ_RATES_CACHE_KEY, None))
+    return changed
 
 
 class HJubranBoqSummary(models.Model):
@@ -30,6 +65,20 @@ class HJubranBoqSummary(models.Model):
         'summary_id',
         string='Scope Summary'
     )
+    content_version = fields.Integer(
+        string='Content Version',
+        default=0,
+        readonly=True,
+        copy=False,
+        help="Incremented each time the queued BOQ line changes of this summary are flushed."
+    )
+    scope_summary_version = fields.Integer(
+        string='Scope Summary Version',
+        default=0,
+        readonly=True,
+        copy=False,
+        help="Content version the scope summary rows were last built from."
+    )
     total_amount = fields.Monetary(
         string='Planned Amount',
         currency_field='currency_id',
@@ -49,88 +98,168 @@ class HJubranBoqSummary(models.Model):
             summary.total_amount = sum(summary.line_ids.mapped('amount'))
             summary.total_actual_amount = sum(summary.line_ids.mapped('actual_amount'))
 
-    def _compute_scope_summary(self):
-        for summary in self:
-            # Delete existing scope summary records
-            summary.scope_summary_ids.unlink()
-            
-            # Get all scopes and aggregate amounts
-            all_scopes = summary.line_ids.mapped('scope')
-            normalized_scopes = {}
-            for scope in all_scopes:
-                if scope:
-                    normalized = str(scope).strip()
-                    if normalized:
-                        key = normalized.lower()
-                        if key not in normalized_scopes:
-                            normalized_scopes[key] = normalized
-            
-            # Create scope summary records
-            scope_summary_model = self.env['h_jubran.boq.summary.scope.summary']
-            for scope_name in sorted(normalized_scopes.values()):
-                scope_lines = summary.line_ids.filtered(
-                    lambda l: l.scope and str(l.scope).strip().lower() == scope_name.lower()
-                )
-                total_amount = sum(scope_lines.mapped('amount')) or 0.0
-                total_actual_amount = sum(scope_lines.mapped('actual_amount')) or 0.0
-                
-                scope_summary_model.create({
-                    'summary_id': summary.id,
-                    'scope': scope_name,
-                    'amount': total_amount,
-                    'actual_amount': total_actual_amount,
-                })
+    def _compute_scope_summary(self, scope_keys=None):
+        """Synchronize scope summary rows with the BOQ lines.
 
-    @api.model
+        Scope totals are read with a single grouped aggregate for all the
+        summaries in ``self`` and diffed against the existing rows, so only
+        the scopes whose totals changed are written. ``scope_keys`` (a set of
+        normalized scope names) restricts the sync to the scopes touched by
+        a line change; ``None`` syncs every scope.
+        """
+        if not self:
+            return
+        domain = [('summary_id', 'in', self.ids), ('scope_key', '!=', False)]
+        if scope_keys is not None:
+            domain.append(('scope_key', 'in', list(scope_keys)))
+        wanted = {}
+        for summary, key, scope, amount, actual_amount in self.env['h_jubran.boq.summary.line']._read_group(
+            domain,
+            ['summary_id', 'scope_key'],
+            # Several spellings of the same scope: keep a stable label
+            ['scope:min', 'amount:sum', 'actual_amount:sum'],
+        ):
+            wanted[(summary.id, key)] = {
+                'scope': _normalize_scope(scope),
+                'amount': amount or 0.0,
+                'actual_amount': actual_amount or 0.0,
+            }
+
+        scope_summary_model = self.env['h_jubran.boq.summary.scope.summary']
+        to_unlink = scope_summary_model
+        existing = {}
+        for row in scope_summary_model.search([('summary_id', 'in', self.ids)]):
+            key = _normalize_scope(row.scope).lower()
+            if scope_keys is not None and key not in scope_keys:
+                continue
+            if (row.summary_id.id, key) in existing or (row.summary_id.id, key) not in wanted:
+                to_unlink |= row
+            else:
+                existing[(row.summary_id.id, key)] = row
+
+        to_create = []
+        for (summary_id, key), totals in wanted.items():
+            row = existing.get((summary_id, key))
+            if not row:
+                to_create.append(dict(totals, summary_id=summary_id))
+                continue
+            currency = row.currency_id or self.env.company.currency_id
+            if (
+                row.scope != totals['scope']
+                or currency.compare_amounts(row.amount, totals['amount'])
+                or currency.compare_amounts(row.actual_amount, totals['actual_amount'])
+            ):
+                row.write(totals)
+
+        if to_unlink:
+            to_unlink.unlink()
+        if to_create:
+            scope_summary_model.create(to_create)
+        self.env.cr.execute(
+            "UPDATE h_jubran_boq_summary SET scope_summary_version = content_version WHERE id IN %s",
+            (tuple(self.ids),)
+        )
+        self.invalidate_recordset(['scope_summary_version'])
+
+    @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
+        # A new summary may become the first one of its project
+        self.env['h_jubran.boq.summary.line']._bump_boq_rate_version(records.project_id)
         # Always compute scope summary
-        for record in records:
-            record._compute_scope_summary()
-            record._auto_create_trees()
+        records._queue_boq_rebuild()
         return records
 
     def write(self, vals):
+        if 'project_id' not in vals:
+            return super().write(vals)
+        projects = self.project_id
         result = super().write(vals)
-        if 'line_ids' in vals:
-            # Always compute scope summary when lines change
-            self._compute_scope_summary()
-            # Automatically update tree views when lines change
-            # Skip during import to avoid blocking
-            if not self.env.context.get('import_file') and not self.env.context.get('import_compat'):
-                for record in self:
-                    try:
-                        record._auto_create_trees()
-                    except Exception:
-                        pass
+        self.env['h_jubran.boq.summary.line']._bump_boq_rate_version(projects | self.project_id)
         return result
 
-    def _auto_create_trees(self):
-        """Automatically create/update category and scope tree views"""
+    def unlink(self):
+        self.env['h_jubran.boq.summary.line']._bump_boq_rate_version(self.project_id)
+        return super().unlink()
+
+    def _queue_boq_rebuild(self, scope_keys=None, trees=True):
+        """Schedule a scope summary and tree rebuild of these summaries.
+
+        Requests are coalesced per transaction in a dirty set that is
+        flushed once by a pre-commit callback, so a batch of line writes
+        rebuilds each summary a single time. ``scope_keys`` restricts the
+        scope summary sync as in ``_compute_scope_summary``. Set
+        ``boq_rebuild_now`` in the context to flush right away when the UI
+        needs fresh data within the same request.
+        """
+        data = self.env.cr.precommit.data
+        queue = data.get('h_jubran.boq.rebuild')
+        if queue is None:
+            queue = data['h_jubran.boq.rebuild'] = {}
+            data['h_jubran.boq.rebuild.requests'] = 0
+            self.env.cr.precommit.add(self._flush_boq_rebuild_queue)
+        data['h_jubran.boq.rebuild.requests'] += 1
         for summary in self:
-            # Create category tree
-            category_tree_model = self.env['h_jubran.boq.summary.category.tree']
-            category_tree_model.create_tree_for_summary(summary.id)
-            
-            # Create scope tree
-            scope_tree_model = self.env['h_jubran.boq.summary.scope.tree']
-            scope_tree_model.create_tree_for_summary(summary.id)
+            entry = queue.setdefault(summary.id, {'scope_keys': set(), 'trees': False})
+            if scope_keys is None:
+                entry['scope_keys'] = None
+            elif entry['scope_keys'] is not None:
+                entry['scope_keys'] |= set(scope_keys)
+            entry['trees'] = entry['trees'] or trees
+        if self.env.context.get('boq_rebuild_now'):
+            self._flush_boq_rebuild_queue()
 
     @api.model
-    def fields_view_get(self, view_id=None, view_type='form', toolbar=False, submenu=False):
-        """Override to ensure scope summary is computed when form is viewed"""
-        result = super().fields_view_get(view_id, view_type, toolbar, submenu)
-        if view_type == 'form' and self.env.context.get('active_id'):
-            record = self.browse(self.env.context['active_id'])
-            if record.exists() and record.line_ids:
-                # Always recompute scope summary when form is viewed
-                record._compute_scope_summary()
-        return result
+    def _flush_boq_rebuild_queue(self):
+        """Run the scope summary and tree rebuilds queued in this transaction"""
+        data = self.env.cr.precommit.data
+        queue = data.pop('h_jubran.boq.rebuild', None)
+        requests = data.pop('h_jubran.boq.rebuild.requests', 0)
+        if not queue:
+            return
+        summaries = self.browse(list(queue)).exists()
+        summaries._bump_content_version()
+        for summary in summaries:
+            summary._compute_scope_summary(queue[summary.id]['scope_keys'])
+        tree_summaries = summaries.filtered(lambda s: queue[s.id]['trees'])
+        tree_summaries._auto_create_trees()
+        self.env.flush_all()
+        _logger.debug(
+            "BOQ rebuild: %d request(s) coalesced into %d scope summary and %d tree rebuild(s)",
+            requests, len(summaries), len(tree_summaries),
+        )
+
+    def _auto_create_trees(self):
+        """Automatically create/update category and scope tree views"""
+        # Create category tree
+        self.env['h_jubran.boq.summary.category.tree']._sync_tree_for_summaries(self)
+        # The scope tree is a SQL view over the lines and needs no sync
+
+    def _rebuild_boq_rollups(self):
+        """Rebuild every rollup of these summaries in one pass.
 
-    @api.onchange('line_ids')
-    def _onchange_line_ids_scope_summary(self):
-        """Compute scope summary when line_ids change"""
+        Used after bulk loads done with ``boq_skip_rebuild`` in the context,
+        which bypasses the per-line hooks.
+        """
         self._compute_scope_summary()
+        self._auto_create_trees()
+        lines = self.env['h_jubran.boq.summary.line'].search([('summary_id', 'in', self.ids)])
+        self.env['h_jubran.boq.summary.category.tree']._mark_amounts_to_recompute(
+            lines._get_subcategory_keys()
+        )
+        lines._recompute_pr_boq_rates(lines)
+        self.env.flush_all()
+
+    def _bump_content_version(self):
+        """Mark the lines of these summaries as changed, once per flush"""
+        if not self:
+            return
+        # Plain increment: concurrent line changes must never lose a bump
+        self.env.cr.execute(
+            "UPDATE h_jubran_boq_summary SET content_version = content_version + 1 WHERE id IN %s",
+            (tuple(self.ids),)
+        )
+        self.invalidate_recordset(['content_version'])
 
     def action_refresh_scope_summary(self):
         """Button action to refresh scope summary"""
@@ -167,10 +296,10 @@ class HJubranBoqSummary(models.Model):
             unique_subcategories = summary.line_ids.mapped('subcategory_id').filtered(lambda sc: sc)
             summary.subcategory_count = len(unique_subcategories)
 
-    @api.depends('line_ids.scope')
+    @api.depends('line_ids.scope_key')
     def _compute_scope_count(self):
         for summary in self:
-            scopes = summary.line_ids.mapped('scope')
+            scopes = summary.line_ids.mapped('scope_key')
             unique_scopes = [s for s in scopes if s]  # Filter out empty/False values
             summary.scope_count = len(set(unique_scopes))  # Get unique count
 
@@ -195,10 +324,6 @@ class HJubranBoqSummary(models.Model):
 
     def action_view_scope_tree(self):
         self.ensure_one()
-        # Create tree records for this summary
-        tree_model = self.env['h_jubran.boq.summary.scope.tree']
-        tree_model.create_tree_for_summary(self.id)
-        
         return {
             'name': _('Scopes'),
             'type': 'ir.actions.act_window',
@@ -215,14 +340,13 @@ class HJubranBoqSummary(models.Model):
     def action_import_lines(self):
         self.ensure_one()
         return {
-            'type': 'ir.actions.client',
-            'tag': 'import',
             'name': _('Import BOQ Summary Lines'),
-            'params': {
-                'model': 'h_jubran.boq.summary.line',
-                'context': {
-                    'default_summary_id': self.id,
-                },
+            'type': 'ir.actions.act_window',
+            'res_model': 'h_jubran.boq.import',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {
+                'default_summary_id': self.id,
             },
         }
 
@@ -236,12 +360,20 @@ class HJubranBoqSummaryLine(models.Model):
         'h_jubran.boq.summary',
         string='BOQ Summary',
         required=True,
-        ondelete='cascade'
+        ondelete='cascade',
+        index=True
     )
     sequence = fields.Integer(default=10)
     number = fields.Char(string='Number')
     code = fields.Char(string='Code', required=True)
     scope = fields.Char(string='Scope', required=True)
+    scope_key = fields.Char(
+        string='Scope Key',
+        compute='_compute_scope_key',
+        store=True,
+        index=True,
+        help="Normalized scope (trimmed, lower case) used to group lines by scope."
+    )
     category_id = fields.Many2one(
         'h_jubran.master.category',
         string='Category',
@@ -319,6 +451,22 @@ class HJubranBoqSummaryLine(models.Model):
         ),
     ]
 
+    def init(self):
+        # Scope and sub-category rollups are always filtered by summary first
+        tools.create_index(
+            self.env.cr, 'h_jubran_boq_summary_line_summary_scope_category_index',
+            self._table, ['summary_id', 'scope_key', 'category_id'],
+        )
+        tools.create_index(
+            self.env.cr, 'h_jubran_boq_summary_line_summary_subcategory_index',
+            self._table, ['summary_id', 'subcategory_id'],
+        )
+
+    @api.depends('scope')
+    def _compute_scope_key(self):
+        for line in self:
+            line.scope_key = _normalize_scope(line.scope).lower() or False
+
     @api.constrains('amount', 'actual_amount')
     def _check_amounts(self):
         for line in self:
@@ -351,19 +499,21 @@ class HJubranBoqSummaryLine(models.Model):
             vals_list = [vals_list]
         
         records = super().create(vals_list)
+        self._bump_boq_rate_version(records.filtered('subcategory_id').summary_id.project_id)
+        if self.env.context.get('boq_skip_rebuild'):
+            # Bulk import: the caller rebuilds the rollups once at the end
+            return records
         
-        # Trigger tree creation and scope summary for all affected summaries
-        summaries = records.mapped('summary_id')
-        for summary in summaries:
-            try:
-                # Always compute scope summary (it's fast)
-                summary._compute_scope_summary()
-                # Only create trees if not in import mode (to avoid blocking)
-                if not self.env.context.get('import_file') and not self.env.context.get('import_compat'):
-                    summary._auto_create_trees()
-            except Exception:
-                # Silently fail to avoid blocking imports
-                pass
+        # Queue tree creation and scope summary for all affected summaries
+        # Only create trees if not in import mode (to avoid blocking)
+        trees = not self.env.context.get('import_file') and not self.env.context.get('import_compat')
+        for summary, scope_keys in records._get_scope_keys_by_summary().items():
+            # Only the scopes of the new lines can have changed
+            summary._queue_boq_rebuild(scope_keys, trees=trees)
+        
+        self.env['h_jubran.boq.summary.category.tree']._mark_amounts_to_recompute(
+            records._get_subcategory_keys()
+        )
         
         # Recompute boq_rate in purchase request lines when new BOQ line is created
         self._recompute_pr_boq_rates(records)
@@ -372,27 +522,141 @@ class HJubranBoqSummaryLine(models.Model):
 
     def write(self, vals):
         """Override write to trigger tree creation on parent summary"""
-        # Get summaries before write
-        summaries = self.mapped('summary_id')
+        # Projects whose BOQ rates may change, including the ones lines leave
+        rate_projects = self.summary_id.project_id if _RATE_FIELDS.intersection(vals) else None
+        if self.env.context.get('boq_skip_rebuild'):
+            result = super().write(vals)
+            if rate_projects is not None:
+                self._bump_boq_rate_version(rate_projects | self.summary_id.project_id)
+            return result
+        # Scopes the lines belong to before the write, so that a line moving
+        # to another scope (or summary) also refreshes the scope it left
+        scope_keys_before = self._get_scope_keys_by_summary()
+        subcategory_keys = self._get_subcategory_keys()
         result = super().write(vals)
-        # Trigger scope summary and tree creation for all affected summaries
-        summaries |= self.mapped('summary_id')
-        for summary in summaries:
-            try:
-                # Always compute scope summary (it's fast)
-                summary._compute_scope_summary()
-                # Only create trees if not in import mode (to avoid blocking)
-                if not self.env.context.get('import_file') and not self.env.context.get('import_compat'):
-                    summary._auto_create_trees()
-            except Exception:
-                pass
+        if rate_projects is not None:
+            self._bump_boq_rate_version(rate_projects | self.summary_id.project_id)
+        scope_keys = self._get_scope_keys_by_summary()
+        for summary, keys in scope_keys_before.items():
+            scope_keys[summary] |= keys
+        # Queue scope summary and tree creation for all affected summaries
+        scope_fields = {'scope', 'scope_key', 'summary_id', 'amount', 'actual_amount'}
+        # The tree nodes only depend on the categories used by the lines
+        # Only create trees if not in import mode (to avoid blocking)
+        trees = (
+            bool({'summary_id', 'category_id'}.intersection(vals))
+            and not self.env.context.get('import_file')
+            and not self.env.context.get('import_compat')
+        )
+        if scope_fields.intersection(vals) or trees:
+            for summary, keys in scope_keys.items():
+                summary._queue_boq_rebuild(keys if scope_fields.intersection(vals) else set(), trees=trees)
+        if {'summary_id', 'subcategory_id', *_AMOUNT_FIELDS}.intersection(vals):
+            self.env['h_jubran.boq.summary.category.tree']._mark_amounts_to_recompute(
+                subcategory_keys | self._get_subcategory_keys()
+            )
         
         # Recompute boq_rate in purchase request lines if rate or subcategory changed
         if 'rate' in vals or 'subcategory_id' in vals or 'category_id' in vals:
             self._recompute_pr_boq_rates(self)
         
         return result
+
+    def _get_scope_keys_by_summary(self):
+        """Return the normalized scope keys of these lines, per summary."""
+        scope_keys = defaultdict(set)
+        for line in self:
+            if line.scope_key:
+                scope_keys[line.summary_id].add(line.scope_key)
+        return scope_keys
+
+    def _get_subcategory_keys(self):
+        """Return the (summary, sub-category) id pairs of these lines."""
+        return {
+            (line.summary_id.id, line.subcategory_id.id)
+            for line in self
+            if line.subcategory_id
+        }
+
+    def _actuals_changed(self):
+        """Propagate actuals updated in SQL on these lines
+
+        Does what ``write`` does after a change of the actual fields: the
+        cache is refreshed, stored fields depending on them are marked to
+        recompute and the scope summaries and category tree amounts of the
+        lines are queued.
+        """
+        if not self:
+            return
+        fnames = ['actual_quantity', 'actual_rate', 'actual_amount']
+        self.invalidate_recordset(fnames)
+        self.modified(fnames)
+        for summary, keys in self._get_scope_keys_by_summary().items():
+            summary._queue_boq_rebuild(keys, trees=False)
+        self.env['h_jubran.boq.summary.category.tree']._mark_amounts_to_recompute(
+            self._get_subcategory_keys()
+        )
     
+    @api.model
+    def _get_boq_rate(self, project_id, subcategory_id, category_id=False):
+        """Return the BOQ rate of a project sub-category (and category)
+
+        Served from a per-project cache keyed on the project's BOQ rate
+        version, so repeated lookups from purchase request and purchase
+        order onchanges do not hit the database. A transaction that changed
+        the rates of a project reads them from the database until it ends,
+        so uncommitted rates never reach the shared cache and rates rolled
+        back to a savepoint are never served.
+        """
+        if not project_id or not subcategory_id:
+            return 0.0
+        if project_id in self.env.cr.cache.get(_BOQ_RATES_CACHE_KEY, ()):
+            rates = self._read_project_boq_rates(project_id)
+        else:
+            version = self.env['h_jubran.project'].browse(project_id).boq_rate_version
+            rates = self._get_project_boq_rates(project_id, version)
+        return rates.get((subcategory_id, category_id or None)) or 0.0
+
+    @api.model
+    @tools.ormcache('project_id', 'rate_version')
+    def _get_project_boq_rates(self, project_id, rate_version):
+        """Cached ``_read_project_boq_rates``; must not be modified by callers"""
+        return self._read_project_boq_rates(project_id)
+
+    @api.model
+    def _read_project_boq_rates(self, project_id):
+        """Return {(sub-category, category or None): rate} of the project.
+
+        The project uses its first BOQ summary (in the summary order) and,
+        for every key, the first matching line of that summary.
+        """
+        summary = self.env['h_jubran.boq.summary'].search([('project_id', '=', project_id)], limit=1)
+        rates = {}
+        if not summary:
+            return rates
+        for line in self.search([('summary_id', '=', summary.id), ('subcategory_id', '!=', False)]):
+            # Lines without a category match on the sub-category alone
+            rates.setdefault((line.subcategory_id.id, None), line.rate)
+            rates.setdefault((line.subcategory_id.id, line.category_id.id), line.rate)
+        return rates
+
+    @api.model
+    def _bump_boq_rate_version(self, projects):
+        """Invalidate the cached BOQ rates of these projects
+
+        Bumps the projects' BOQ rate version, which is part of the cache key,
+        so the other workers stop using the old rates once this transaction
+        commits; no other cache is cleared.
+        """
+        if not projects:
+            return
+        self.env.cr.execute(
+            "UPDATE h_jubran_project SET boq_rate_version = boq_rate_version + 1 WHERE id IN %s",
+            (tuple(projects.ids),)
+        )
+        projects.invalidate_recordset(['boq_rate_version'])
+        _boq_rates_changed(self.env.cr).update(projects.ids)
+
     def _recompute_pr_boq_rates(self, boq_lines):
         """Recompute boq_rate in purchase request lines for given BOQ summary lines"""
         if not boq_lines:
@@ -403,9 +667,10 @@ class HJubranBoqSummaryLine(models.Model):
         if not subcategory_ids:
             return
         
-        # Find all purchase request lines with matching subcategories
+        # Find the purchase request lines with matching subcategories in the same projects
         pr_lines = self.env['h_jubran.purchase.request.line'].search([
-            ('subcategory_id', 'in', subcategory_ids)
+            ('subcategory_id', 'in', subcategory_ids),
+            ('project_id', 'in', boq_lines.summary_id.project_id.ids),
         ])
         
         if pr_lines:
@@ -414,15 +679,16 @@ class HJubranBoqSummaryLine(models.Model):
 
     def unlink(self):
         """Override unlink to trigger tree creation on parent summary"""
-        summaries = self.mapped('summary_id')
+        self._bump_boq_rate_version(self.filtered('subcategory_id').summary_id.project_id)
+        if self.env.context.get('boq_skip_rebuild'):
+            return super().unlink()
+        scope_keys = self._get_scope_keys_by_summary()
+        subcategory_keys = self._get_subcategory_keys()
         result = super().unlink()
-        # Trigger tree creation for all affected summaries
-        for summary in summaries:
-            try:
-                summary._auto_create_trees()
-                summary._compute_scope_summary()
-            except Exception:
-                pass
+        self.env['h_jubran.boq.summary.category.tree']._mark_amounts_to_recompute(subcategory_keys)
+        # Queue tree creation for all affected summaries
+        for summary, keys in scope_keys.items():
+            summary._queue_boq_rebuild(keys)
         return result
 
 
@@ -520,30 +786,47 @@ class HJubranBoqSummaryCategoryTree(models.Model):
             else:
                 record.name = ''
 
-    @api.depends('category_id', 'subcategory_id', 'summary_id', 'summary_id.line_ids', 'summary_id.line_ids.subcategory_id', 
-                 'summary_id.line_ids.quantity', 'summary_id.line_ids.actual_quantity', 
-                 'summary_id.line_ids.rate', 'summary_id.line_ids.actual_rate',
-                 'summary_id.line_ids.amount', 'summary_id.line_ids.actual_amount')
+    @api.depends('summary_id', 'subcategory_id', 'is_subcategory')
     def _compute_amounts(self):
+        """Roll up the BOQ line values of each sub-category node.
+
+        The whole batch is served by one grouped read keyed by (summary,
+        sub-category). Line changes do not go through ``@api.depends``:
+        the line hooks only mark the nodes of the keys they touched, see
+        ``_mark_amounts_to_recompute``.
+        """
+        nodes = self.filtered(lambda r: r.is_subcategory and r.subcategory_id)
+        totals = {}
+        if nodes:
+            for summary, subcategory, *sums in self.env['h_jubran.boq.summary.line']._read_group(
+                [
+                    ('summary_id', 'in', nodes.summary_id.ids),
+                    ('subcategory_id', 'in', nodes.subcategory_id.ids),
+                ],
+                ['summary_id', 'subcategory_id'],
+                [f'{fname}:sum' for fname in _AMOUNT_FIELDS],
+            ):
+                totals[(summary.id, subcategory.id)] = sums
         for record in self:
+            # Sub-categories show values from BOQ lines, other nodes zero
+            sums = None
             if record.is_subcategory and record.subcategory_id:
-                # Sub-categories show values from BOQ lines
-                lines = record.summary_id.line_ids.filtered(
-                    lambda l: l.subcategory_id and l.subcategory_id.id == record.subcategory_id.id
-                )
-                record.quantity = sum(lines.mapped('quantity')) or 0.0
-                record.actual_quantity = sum(lines.mapped('actual_quantity')) or 0.0
-                record.rate = sum(lines.mapped('rate')) or 0.0
-                record.actual_rate = sum(lines.mapped('actual_rate')) or 0.0
-                record.amount = sum(lines.mapped('amount')) or 0.0
-                record.actual_amount = sum(lines.mapped('actual_amount')) or 0.0
-            else:
-                record.quantity = 0.0
-                record.actual_quantity = 0.0
-                record.rate = 0.0
-                record.actual_rate = 0.0
-                record.amount = 0.0
-                record.actual_amount = 0.0
+                sums = totals.get((record.summary_id.id, record.subcategory_id.id))
+            for fname, value in zip(_AMOUNT_FIELDS, sums or [0.0] * len(_AMOUNT_FIELDS)):
+                record[fname] = value or 0.0
+
+    @api.model
+    def _mark_amounts_to_recompute(self, keys):
+        """Schedule the recompute of the nodes matching (summary, sub-category) ``keys``"""
+        if not keys:
+            return
+        nodes = self.search([
+            ('summary_id', 'in', list({summary_id for summary_id, _subcat_id in keys})),
+            ('subcategory_id', 'in', list({subcat_id for _summary_id, subcat_id in keys})),
+        ]).filtered(lambda n: (n.summary_id.id, n.subcategory_id.id) in keys)
+        if nodes:
+            for fname in _AMOUNT_FIELDS:
+                self.env.add_to_compute(self._fields[fname], nodes)
 
     def write(self, vals):
         """Override write to update underlying BOQ lines when tree view fields are edited"""
@@ -685,7 +968,7 @@ class HJubranBoqSummaryCategoryTree(models.Model):
         
         return result
 
-    @api.model
+    @api.model_create_multi
     def create(self, vals_list):
         """Override create to ensure name is computed"""
         records = super().create(vals_list)
@@ -699,288 +982,193 @@ class HJubranBoqSummaryCategoryTree(models.Model):
         summary = self.env['h_jubran.boq.summary'].browse(summary_id)
         if not summary.exists():
             return
-        
-        # Delete existing tree records for this summary
-        self.search([('summary_id', '=', summary_id)]).unlink()
-        
-        # Get all unique categories from BOQ Summary Lines
-        unique_categories = summary.line_ids.mapped('category_id').filtered(lambda c: c)
-        
-        tree_records = []
-        for category in unique_categories:
-            # Create sub-category nodes for all master sub-categories under this category
-            subcategories = category.subcategory_ids
-            if not subcategories:
-                # If no sub-categories exist, skip to next category
-                continue
+        self._sync_tree_for_summaries(summary)
+        return self.search([('summary_id', '=', summary_id)])
 
-            for subcat in subcategories:
-                subcat_node = self.create({
-                    'summary_id': summary_id,
-                    'category_id': category.id,
-                    'subcategory_id': subcat.id,
-                    'is_subcategory': True,
-                    'parent_id': False,  # No parent, just flat list of subcategories
-                    'sequence': subcat.id,
-                })
-                tree_records.append(subcat_node)
-        
-        return tree_records
+    @api.model
+    def _sync_tree_for_summaries(self, summaries):
+        """Apply the difference between wanted and stored sub-category nodes.
+
+        A node is wanted for every master sub-category of each category used
+        on the summary lines. Missing nodes are created in one batch and
+        obsolete ones unlinked at once; surviving nodes keep their ids so the
+        grouped list in the web client stays put.
+        """
+        if not summaries:
+            return
+        categories_by_summary = defaultdict(list)
+        for summary, category in self.env['h_jubran.boq.summary.line']._read_group(
+            [('summary_id', 'in', summaries.ids), ('category_id', '!=', False)],
+            ['summary_id', 'category_id'],
+        ):
+            categories_by_summary[summary.id].append(category.id)
+
+        subcategories_by_category = defaultdict(list)
+        category_ids = {cid for cids in categories_by_summary.values() for cid in cids}
+        if category_ids:
+            for subcat in self.env['h_jubran.master.subcategory'].search([
+                ('category_id', 'in', list(category_ids)),
+            ]):
+                subcategories_by_category[subcat.category_id.id].append(subcat.id)
+
+        wanted = {
+            (summary_id, category_id, subcat_id)
+            for summary_id, category_ids in categories_by_summary.items()
+            for category_id in category_ids
+            for subcat_id in subcategories_by_category[category_id]
+        }
+
+        to_unlink = self
+        existing = set()
+        for node in self.search([('summary_id', 'in', summaries.ids)]):
+            key = (node.summary_id.id, node.category_id.id, node.subcategory_id.id)
+            if not node.is_subcategory or key in existing or key not in wanted:
+                to_unlink |= node
+            else:
+                existing.add(key)
+
+        if to_unlink:
+            to_unlink.unlink()
+        to_create = [{
+            'summary_id': summary_id,
+            'category_id': category_id,
+            'subcategory_id': subcat_id,
+            'is_subcategory': True,
+            'parent_id': False,  # No parent, just flat list of subcategories
+            'sequence': subcat_id,
+        } for summary_id, category_id, subcat_id in sorted(wanted - existing)]
+        if to_create:
+            self.create(to_create)
 
 
 class HJubranBoqSummaryScopeTree(models.Model):
     _name = 'h_jubran.boq.summary.scope.tree'
     _description = 'BOQ Summary Scope Tree View'
-    _order = 'parent_id, sequence, id'
-    _parent_name = 'parent_id'
-    _parent_store = True
+    _auto = False
+    _order = 'scope, sequence, id'
+    _depends = {
+        'h_jubran.boq.summary.line': [
+            'summary_id', 'scope', 'scope_key', 'code', 'sequence', 'category_id', 'currency_id',
+            'quantity', 'actual_quantity', 'rate', 'actual_rate', 'amount', 'actual_amount',
+        ],
+        'h_jubran.master.category': ['code', 'name'],
+    }
 
-    name = fields.Char(string='Name', compute='_compute_name', store=True)
+    name = fields.Char(string='Name', readonly=True)
     summary_id = fields.Many2one(
         'h_jubran.boq.summary',
         string='BOQ Summary',
-        required=True,
-        ondelete='cascade',
-        index=True
+        readonly=True
     )
-    scope = fields.Char(string='Scope')
-    code = fields.Char(string='Code', compute='_compute_code', store=True)
+    scope = fields.Char(string='Scope', readonly=True)
+    scope_key = fields.Char(string='Scope Key', readonly=True)
+    code = fields.Char(string='Code', readonly=True)
     category_id = fields.Many2one(
         'h_jubran.master.category',
         string='Category',
-        ondelete='cascade'
-    )
-    parent_id = fields.Many2one(
-        'h_jubran.boq.summary.scope.tree',
-        string='Parent',
-        ondelete='cascade',
-        index=True
-    )
-    parent_path = fields.Char(index=True)
-    sequence = fields.Integer(default=10)
-    is_scope = fields.Boolean(string='Is Scope', default=False)
-    is_category = fields.Boolean(string='Is Category', default=False)
-    
-    # Fields from BOQ Summary Lines
-    quantity = fields.Float(
-        string='Quantity',
-        digits=(16, 2),
-        compute='_compute_amounts',
-        store=True,
-        readonly=False
-    )
-    actual_quantity = fields.Float(
-        string='Actual Quantity',
-        digits=(16, 2),
-        compute='_compute_amounts',
-        store=True,
-        readonly=False
-    )
-    rate = fields.Monetary(
-        string='Rate',
-        currency_field='currency_id',
-        compute='_compute_amounts',
-        store=True,
-        readonly=False
-    )
-    actual_rate = fields.Monetary(
-        string='Actual Rate',
-        currency_field='currency_id',
-        compute='_compute_amounts',
-        store=True,
-        readonly=False
-    )
-    amount = fields.Monetary(
-        string='Amount',
-        currency_field='currency_id',
-        compute='_compute_amounts',
-        store=True,
-        readonly=False
-    )
-    actual_amount = fields.Monetary(
-        string='Actual Amount',
-        currency_field='currency_id',
-        compute='_compute_amounts',
-        store=True,
-        readonly=False
-    )
-    currency_id = fields.Many2one(
-        'res.currency',
-        related='summary_id.currency_id',
-        store=True,
         readonly=True
     )
+    sequence = fields.Integer(readonly=True)
+    is_scope = fields.Boolean(string='Is Scope', readonly=True)
+    is_category = fields.Boolean(string='Is Category', readonly=True)
+    
+    # Fields from BOQ Summary Lines (planned values are written through to
+    # the lines; actuals come from the BOQ actuals ledger)
+    quantity = fields.Float(string='Quantity', digits=(16, 2))
+    actual_quantity = fields.Float(string='Actual Quantity', digits=(16, 2), readonly=True)
+    rate = fields.Monetary(string='Rate', currency_field='currency_id')
+    actual_rate = fields.Monetary(string='Actual Rate', currency_field='currency_id', readonly=True)
+    amount = fields.Monetary(string='Amount', currency_field='currency_id')
+    actual_amount = fields.Monetary(string='Actual Amount', currency_field='currency_id', readonly=True)
+    currency_id = fields.Many2one('res.currency', readonly=True)
 
-    @api.depends('scope', 'category_id', 'is_scope', 'is_category', 'category_id.code', 'category_id.name')
-    def _compute_name(self):
-        for record in self:
-            if record.is_category and record.category_id:
-                record.name = f"{record.category_id.code} - {record.category_id.name}"
-            else:
-                record.name = ''
-
-    @api.depends('scope', 'category_id', 'summary_id', 'summary_id.line_ids', 
-                 'summary_id.line_ids.scope', 'summary_id.line_ids.category_id',
-                 'summary_id.line_ids.code')
-    def _compute_code(self):
-        for record in self:
-            if record.is_category and record.category_id and record.scope:
-                # Category: get codes from BOQ lines matching this scope and category
-                lines = record.summary_id.line_ids.filtered(
-                    lambda l: l.scope and str(l.scope).strip() == str(record.scope).strip() and 
-                             l.category_id and l.category_id.id == record.category_id.id
-                )
-                codes = lines.mapped('code')
-                record.code = ', '.join([c for c in codes if c]) if codes else ''
-            else:
-                record.code = ''
-
-    @api.depends('scope', 'category_id', 'summary_id', 'summary_id.line_ids', 
-                 'summary_id.line_ids.scope', 'summary_id.line_ids.category_id',
-                 'summary_id.line_ids.quantity', 'summary_id.line_ids.actual_quantity', 
-                 'summary_id.line_ids.rate', 'summary_id.line_ids.actual_rate',
-                 'summary_id.line_ids.amount', 'summary_id.line_ids.actual_amount')
-    def _compute_amounts(self):
-        for record in self:
-            if record.is_category and record.category_id and record.scope:
-                # Category: sum from BOQ lines matching this scope and category
-                lines = record.summary_id.line_ids.filtered(
-                    lambda l: l.scope and str(l.scope).strip() == str(record.scope).strip() and 
-                             l.category_id and l.category_id.id == record.category_id.id
-                )
-                record.quantity = sum(lines.mapped('quantity')) or 0.0
-                record.actual_quantity = sum(lines.mapped('actual_quantity')) or 0.0
-                record.rate = sum(lines.mapped('rate')) or 0.0
-                record.actual_rate = sum(lines.mapped('actual_rate')) or 0.0
-                record.amount = sum(lines.mapped('amount')) or 0.0
-                record.actual_amount = sum(lines.mapped('actual_amount')) or 0.0
-            else:
-                record.quantity = 0.0
-                record.actual_quantity = 0.0
-                record.rate = 0.0
-                record.actual_rate = 0.0
-                record.amount = 0.0
-                record.actual_amount = 0.0
+    def init(self):
+        # This model used to be a stored table; drop it when upgrading
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", (self._table,))
+        row = self.env.cr.fetchone()
+        if row and row[0] == 'r':
+            self.env.cr.execute(f'DROP TABLE "{self._table}" CASCADE')
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        # One row per (summary, scope, category, currency). A row's id is a
+        # 52-bit hash of that group key (exact as a JS number), so it does
+        # not change when lines are added to or removed from the group
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT
+                    ('x' || SUBSTR(MD5(CONCAT_WS('|',
+                        l.summary_id, l.scope_key, l.category_id, l.currency_id
+                    )), 1, 13))::bit(52)::bigint AS id,
+                    l.summary_id AS summary_id,
+                    l.scope_key AS scope_key,
+                    MIN(TRIM(l.scope)) AS scope,
+                    l.category_id AS category_id,
+                    CONCAT(c.code, ' - ', c.name) AS name,
+                    l.category_id AS sequence,
+                    FALSE AS is_scope,
+                    TRUE AS is_category,
+                    STRING_AGG(l.code, ', ' ORDER BY l.sequence, l.id) AS code,
+                    SUM(COALESCE(l.quantity, 0.0)) AS quantity,
+                    SUM(COALESCE(l.actual_quantity, 0.0)) AS actual_quantity,
+                    SUM(COALESCE(l.rate, 0.0)) AS rate,
+                    SUM(COALESCE(l.actual_rate, 0.0)) AS actual_rate,
+                    SUM(COALESCE(l.amount, 0.0)) AS amount,
+                    SUM(COALESCE(l.actual_amount, 0.0)) AS actual_amount,
+                    l.currency_id AS currency_id
+                FROM h_jubran_boq_summary_line l
+                JOIN h_jubran_master_category c ON c.id = l.category_id
+                WHERE l.scope_key IS NOT NULL
+                GROUP BY l.summary_id, l.scope_key, l.category_id,
+                         c.code, c.name, l.currency_id
+            )
+        """)
 
     def write(self, vals):
-        """Override write to update underlying BOQ lines when tree view fields are edited"""
-        result = super().write(vals)
-        
-        # If editing quantity, rate, or amount fields, update the underlying BOQ lines
-        editable_fields = {'quantity', 'actual_quantity', 'rate', 'actual_rate', 'amount', 'actual_amount'}
-        if editable_fields.intersection(vals.keys()):
-            for record in self:
-                if record.is_category and record.category_id and record.scope:
-                    # Get all BOQ lines for this scope and category
-                    boq_lines = record.summary_id.line_ids.filtered(
-                        lambda l: l.scope and str(l.scope).strip() == str(record.scope).strip() and 
-                                 l.category_id and l.category_id.id == record.category_id.id
-                    )
-                    if boq_lines:
-                        # If there's only one line, update it directly
-                        if len(boq_lines) == 1:
-                            line_vals = {}
-                            if 'quantity' in vals:
-                                line_vals['quantity'] = vals['quantity']
-                            if 'actual_quantity' in vals:
-                                line_vals['actual_quantity'] = vals['actual_quantity']
-                            if 'rate' in vals:
-                                line_vals['rate'] = vals['rate']
-                            if 'actual_rate' in vals:
-                                line_vals['actual_rate'] = vals['actual_rate']
-                            if 'amount' in vals:
-                                line_vals['amount'] = vals['amount']
-                            if 'actual_amount' in vals:
-                                line_vals['actual_amount'] = vals['actual_amount']
-                            if line_vals:
-                                boq_lines.write(line_vals)
-                        # If multiple lines, distribute proportionally
-                        else:
-                            line_vals = {}
-                            if 'quantity' in vals:
-                                line_vals['quantity'] = vals['quantity'] / len(boq_lines)
-                            if 'actual_quantity' in vals:
-                                line_vals['actual_quantity'] = vals['actual_quantity'] / len(boq_lines)
-                            if 'rate' in vals:
-                                line_vals['rate'] = vals['rate']
-                            if 'actual_rate' in vals:
-                                line_vals['actual_rate'] = vals['actual_rate']
-                            if 'amount' in vals:
-                                if 'quantity' in vals and 'rate' in vals:
-                                    line_vals['amount'] = (vals['quantity'] / len(boq_lines)) * vals['rate']
-                                else:
-                                    line_vals['amount'] = vals['amount'] / len(boq_lines)
-                            if 'actual_amount' in vals:
-                                if 'actual_quantity' in vals and 'actual_rate' in vals:
-                                    line_vals['actual_amount'] = (vals['actual_quantity'] / len(boq_lines)) * vals['actual_rate']
-                                else:
-                                    line_vals['actual_amount'] = vals['actual_amount'] / len(boq_lines)
-                            if line_vals:
-                                # Update BOQ lines first, before super().write() triggers recomputation
-                                boq_lines.write(line_vals)
-            
-            # Now call super().write() with vals that exclude computed fields
-            # This will trigger recomputation which will read the updated BOQ line values
-            result = super().write(vals_to_write)
-        else:
-            result = super().write(vals)
-        
-        return result
+        """Rows are read from a SQL view: edits are pushed to the BOQ lines"""
+        editable_fields = {'quantity', 'rate', 'amount'}
+        if set(vals) - editable_fields:
+            raise UserError(_("Only planned quantities, rates and amounts can be edited from the scope view."))
+        self._inverse_boq_lines(vals)
+        return True
 
-    @api.model
-    def create(self, vals_list):
-        """Override create to ensure name is computed"""
-        records = super().create(vals_list)
-        # Trigger computation of name field
-        records._compute_name()
-        return records
+    def _get_boq_lines(self):
+        """Return the BOQ lines behind each row, keyed by row id"""
+        lines_by_key = defaultdict(lambda: self.env['h_jubran.boq.summary.line'])
+        for line in self.env['h_jubran.boq.summary.line'].search([
+            ('summary_id', 'in', self.summary_id.ids),
+            ('scope_key', 'in', list(set(self.mapped('scope_key')))),
+            ('category_id', 'in', self.category_id.ids),
+        ]):
+            key = (line.summary_id.id, line.scope_key, line.category_id.id)
+            lines_by_key[key] |= line
+        return {
+            record.id: lines_by_key[(record.summary_id.id, record.scope_key, record.category_id.id)]
+            for record in self
+        }
 
-    @api.model
-    def create_tree_for_summary(self, summary_id):
-        """Create tree records for a BOQ Summary - Only Category nodes, grouped by scope"""
-        summary = self.env['h_jubran.boq.summary'].browse(summary_id)
-        if not summary.exists():
-            return
-        
-        # Delete existing tree records for this summary
-        self.search([('summary_id', '=', summary_id)]).unlink()
-        
-        # Get all scopes from BOQ Summary Lines, normalize them (strip whitespace, case-insensitive)
-        all_scopes = summary.line_ids.mapped('scope')
-        # Normalize scope names (strip whitespace, convert to string, lowercase for comparison)
-        normalized_scopes = {}
-        for scope in all_scopes:
-            if scope:
-                normalized = str(scope).strip()
-                if normalized:
-                    # Use lowercase normalized name as key to ensure uniqueness
-                    key = normalized.lower()
-                    if key not in normalized_scopes:
-                        normalized_scopes[key] = normalized  # Store original with proper case
-        
-        tree_records = []
-        # Sort by original scope name (not the key)
-        for scope_name in sorted(normalized_scopes.values()):
-            # Get unique categories for this scope (match by normalized scope name - case insensitive)
-            scope_lines = summary.line_ids.filtered(
-                lambda l: l.scope and str(l.scope).strip().lower() == scope_name.lower()
-            )
-            unique_categories = scope_lines.mapped('category_id').filtered(lambda c: c)
-            
-            # Create only category nodes (no scope parent nodes)
-            for category in unique_categories:
-                category_node = self.create({
-                    'summary_id': summary_id,
-                    'scope': scope_name,  # Store scope for grouping
-                    'category_id': category.id,
-                    'is_category': True,
-                    'is_scope': False,
-                    'parent_id': False,  # No parent - will be grouped by scope field
-                    'sequence': category.id,
-                })
-                tree_records.append(category_node)
-        
-        return tree_records
+    def _inverse_boq_lines(self, vals):
+        """Write edited row values back to the underlying BOQ lines"""
+        lines_by_record = self._get_boq_lines()
+        for record in self:
+            boq_lines = lines_by_record[record.id]
+            if not boq_lines:
+                continue
+            # If there's only one line, update it directly
+            if len(boq_lines) == 1:
+                line_vals = dict(vals)
+            # If multiple lines, distribute proportionally
+            else:
+                line_vals = {}
+                if 'quantity' in vals:
+                    line_vals['quantity'] = vals['quantity'] / len(boq_lines)
+                if 'rate' in vals:
+                    line_vals['rate'] = vals['rate']
+                if 'amount' in vals:
+                    if 'quantity' in vals and 'rate' in vals:
+                        line_vals['amount'] = (vals['quantity'] / len(boq_lines)) * vals['rate']
+                    else:
+                        line_vals['amount'] = vals['amount'] / len(boq_lines)
+            if line_vals:
+                boq_lines.write(line_vals)
 
 
 class HJubranBoqSummaryScopeSummary(models.Model):
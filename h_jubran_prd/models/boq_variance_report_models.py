@@ -0,0 +1,226 @@
+import logging
+
+from odoo import fields, models, api, _
+
+_logger = logging.getLogger(__name__)
+
+
+class HJubranBoqVarianceReport(models.Model):
+    _name = 'h_jubran.boq.variance.report'
+    _description = 'BOQ Budget vs Actual Variance Report'
+    _auto = False
+    _order = 'project_id, scope, category_id, subcategory_id'
+
+    project_id = fields.Many2one('h_jubran.project', string='Project', readonly=True)
+    summary_id = fields.Many2one('h_jubran.boq.summary', string='BOQ Summary', readonly=True)
+    boq_line_id = fields.Many2one('h_jubran.boq.summary.line', string='BOQ Line', readonly=True)
+    scope = fields.Char(string='Scope', readonly=True)
+    category_id = fields.Many2one('h_jubran.master.category', string='Category', readonly=True)
+    subcategory_id = fields.Many2one('h_jubran.master.subcategory', string='Sub-Category', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Currency', readonly=True)
+
+    planned_quantity = fields.Float(string='Planned Quantity', digits=(16, 2), readonly=True)
+    planned_rate = fields.Monetary(string='Planned Rate', currency_field='currency_id', aggregator='avg', readonly=True)
+    planned_amount = fields.Monetary(string='Planned Amount', currency_field='currency_id', readonly=True)
+
+    purchase_quantity = fields.Float(string='Open PO Quantity', digits=(16, 2), readonly=True)
+    purchase_amount = fields.Monetary(
+        string='Open PO Amount',
+        currency_field='currency_id',
+        readonly=True,
+        help="Part of the confirmed purchase orders not billed yet; billed parts are in the billed amount."
+    )
+    bill_quantity = fields.Float(string='Billed Quantity', digits=(16, 2), readonly=True)
+    bill_amount = fields.Monetary(string='Billed Amount', currency_field='currency_id', readonly=True)
+    petty_cash_quantity = fields.Float(string='Petty Cash Quantity', digits=(16, 2), readonly=True)
+    petty_cash_amount = fields.Monetary(string='Petty Cash Amount', currency_field='currency_id', readonly=True)
+
+    actual_quantity = fields.Float(string='Actual Quantity', digits=(16, 2), readonly=True)
+    actual_rate = fields.Monetary(string='Actual Rate', currency_field='currency_id', aggregator='avg', readonly=True)
+    actual_amount = fields.Monetary(string='Actual Amount', currency_field='currency_id', readonly=True)
+
+    quantity_variance = fields.Float(string='Quantity Variance', digits=(16, 2), readonly=True)
+    rate_variance = fields.Monetary(string='Rate Variance', currency_field='currency_id', aggregator='avg', readonly=True)
+    amount_variance = fields.Monetary(
+        string='Amount Variance',
+        currency_field='currency_id',
+        readonly=True,
+        help="Planned amount minus actual amount; negative when over budget."
+    )
+    quantity_variance_pct = fields.Float(string='Quantity Variance (%)', digits=(16, 2), aggregator='avg', readonly=True)
+    amount_variance_pct = fields.Float(string='Amount Variance (%)', digits=(16, 2), aggregator='avg', readonly=True)
+    is_over_budget = fields.Boolean(string='Over Budget', readonly=True)
+
+    def init(self):
+        """Create the report as a materialized view.
+
+        There is one row per BOQ line. Actuals are known per (project,
+        sub-category) only, so they are spread over the BOQ lines of the key
+        in proportion of their planned amount (evenly when nothing is
+        planned); actuals without any BOQ line get an unbudgeted row of
+        their own. Rows keep their id across refreshes: the BOQ line id,
+        or minus the (project, sub-category) key for unbudgeted rows.
+        Actuals are read from the BOQ actuals ledger, the source of the BOQ
+        line actuals: the unbilled part of confirmed purchase orders, posted
+        vendor bills and petty cash, split per source.
+        """
+        cr = self.env.cr
+        cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", (self._table,))
+        row = cr.fetchone()
+        if row and row[0] == 'm':
+            cr.execute(f'DROP MATERIALIZED VIEW "{self._table}" CASCADE')
+        elif row and row[0] == 'v':
+            cr.execute(f'DROP VIEW "{self._table}" CASCADE')
+        cr.execute(f"""
+            CREATE MATERIALIZED VIEW {self._table} AS (
+                WITH boq AS (
+                    SELECT
+                        l.id AS boq_line_id,
+                        s.project_id,
+                        l.summary_id,
+                        TRIM(l.scope) AS scope,
+                        l.category_id,
+                        l.subcategory_id,
+                        l.currency_id,
+                        COALESCE(l.quantity, 0.0) AS quantity,
+                        COALESCE(l.rate, 0.0) AS rate,
+                        COALESCE(l.amount, 0.0) AS amount,
+                        SUM(COALESCE(l.amount, 0.0)) OVER key AS key_amount,
+                        COUNT(*) OVER key AS key_lines
+                    FROM h_jubran_boq_summary_line l
+                    JOIN h_jubran_boq_summary s ON s.id = l.summary_id
+                    WINDOW key AS (PARTITION BY s.project_id, l.subcategory_id)
+                ),
+                sources AS (
+                    SELECT
+                        project_id,
+                        subcategory_id,
+                        CASE WHEN source_model = 'purchase.order' THEN quantity ELSE 0.0 END AS purchase_quantity,
+                        CASE WHEN source_model = 'purchase.order' THEN amount ELSE 0.0 END AS purchase_amount,
+                        CASE WHEN source_model = 'account.move' THEN quantity ELSE 0.0 END AS bill_quantity,
+                        CASE WHEN source_model = 'account.move' THEN amount ELSE 0.0 END AS bill_amount,
+                        CASE WHEN source_model = 'h_jubran.petty.cash.breakdown' THEN quantity ELSE 0.0 END AS petty_cash_quantity,
+                        CASE WHEN source_model = 'h_jubran.petty.cash.breakdown' THEN amount ELSE 0.0 END AS petty_cash_amount
+                    FROM h_jubran_boq_actual_entry
+                ),
+                actuals AS (
+                    SELECT
+                        project_id,
+                        subcategory_id,
+                        SUM(purchase_quantity) AS purchase_quantity,
+                        SUM(purchase_amount) AS purchase_amount,
+                        SUM(bill_quantity) AS bill_quantity,
+                        SUM(bill_amount) AS bill_amount,
+                        SUM(petty_cash_quantity) AS petty_cash_quantity,
+                        SUM(petty_cash_amount) AS petty_cash_amount
+                    FROM sources
+                    GROUP BY project_id, subcategory_id
+                ),
+                allocated AS (
+                    SELECT
+                        b.boq_line_id, b.project_id, b.summary_id, b.scope,
+                        b.category_id, b.subcategory_id, b.currency_id,
+                        b.quantity AS planned_quantity,
+                        b.rate AS planned_rate,
+                        b.amount AS planned_amount,
+                        share * COALESCE(a.purchase_quantity, 0.0) AS purchase_quantity,
+                        share * COALESCE(a.purchase_amount, 0.0) AS purchase_amount,
+                        share * COALESCE(a.bill_quantity, 0.0) AS bill_quantity,
+                        share * COALESCE(a.bill_amount, 0.0) AS bill_amount,
+                        share * COALESCE(a.petty_cash_quantity, 0.0) AS petty_cash_quantity,
+                        share * COALESCE(a.petty_cash_amount, 0.0) AS petty_cash_amount
+                    FROM boq b
+                    CROSS JOIN LATERAL (
+                        SELECT CASE WHEN b.key_amount != 0.0 THEN b.amount / b.key_amount
+                                    ELSE 1.0 / b.key_lines END AS share
+                    ) sh
+                    LEFT JOIN actuals a
+                           ON a.project_id = b.project_id
+                          AND a.subcategory_id = b.subcategory_id
+                    UNION ALL
+                    SELECT
+                        NULL, a.project_id, NULL, NULL,
+                        sc.category_id, a.subcategory_id, NULL,
+                        0.0, 0.0, 0.0,
+                        a.purchase_quantity, a.purchase_amount,
+                        a.bill_quantity, a.bill_amount,
+                        a.petty_cash_quantity, a.petty_cash_amount
+                    FROM actuals a
+                    JOIN h_jubran_master_subcategory sc ON sc.id = a.subcategory_id
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM boq b
+                         WHERE b.project_id = a.project_id
+                           AND b.subcategory_id = a.subcategory_id
+                    )
+                ),
+                totals AS (
+                    SELECT
+                        al.*,
+                        al.purchase_quantity + al.bill_quantity + al.petty_cash_quantity AS actual_quantity,
+                        al.purchase_amount + al.bill_amount + al.petty_cash_amount AS actual_amount
+                    FROM allocated al
+                )
+                SELECT
+                    -- Stable across refreshes: the BOQ line, or a negative (project, sub-category) key
+                    COALESCE(t.boq_line_id, -((t.project_id::bigint << 31) | t.subcategory_id)) AS id,
+                    t.project_id,
+                    t.summary_id,
+                    t.boq_line_id,
+                    t.scope,
+                    t.category_id,
+                    t.subcategory_id,
+                    COALESCE(t.currency_id, p.currency_id) AS currency_id,
+                    t.planned_quantity,
+                    t.planned_rate,
+                    t.planned_amount,
+                    t.purchase_quantity,
+                    t.purchase_amount,
+                    t.bill_quantity,
+                    t.bill_amount,
+                    t.petty_cash_quantity,
+                    t.petty_cash_amount,
+                    t.actual_quantity,
+                    CASE WHEN t.actual_quantity != 0.0 THEN t.actual_amount / t.actual_quantity
+                         ELSE 0.0 END AS actual_rate,
+                    t.actual_amount,
+                    t.planned_quantity - t.actual_quantity AS quantity_variance,
+                    t.planned_rate - CASE WHEN t.actual_quantity != 0.0 THEN t.actual_amount / t.actual_quantity
+                                          ELSE 0.0 END AS rate_variance,
+                    t.planned_amount - t.actual_amount AS amount_variance,
+                    CASE WHEN t.planned_quantity != 0.0
+                         THEN 100.0 * (t.planned_quantity - t.actual_quantity) / t.planned_quantity
+                         ELSE 0.0 END AS quantity_variance_pct,
+                    CASE WHEN t.planned_amount != 0.0
+                         THEN 100.0 * (t.planned_amount - t.actual_amount) / t.planned_amount
+                         ELSE 0.0 END AS amount_variance_pct,
+                    t.actual_amount > t.planned_amount AS is_over_budget
+                FROM totals t
+                JOIN h_jubran_project p ON p.id = t.project_id
+            )
+        """)
+        # REFRESH ... CONCURRENTLY needs a unique index on the view
+        cr.execute(f'CREATE UNIQUE INDEX "{self._table}_id_index" ON {self._table} (id)')
+        cr.execute(f'CREATE INDEX "{self._table}_project_index" ON {self._table} (project_id, subcategory_id)')
+
+    @api.model
+    def _refresh(self):
+        """Refresh the materialized view without blocking readers"""
+        self.env.flush_all()
+        self.env.cr.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}')
+        self.invalidate_model()
+        _logger.info("BOQ variance report refreshed")
+
+    @api.model
+    def action_refresh(self):
+        self._refresh()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Variance Report Refreshed'),
+                'message': _('The BOQ variance report now reflects the latest orders, bills and petty cash.'),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import fields, models, api
 
 
@@ -55,10 +57,82 @@ class HJubranMasterSubCategory(models.Model):
         help="Weighted average rate from all confirmed vendor bills for this subcategory"
     )
 
+    # Running petty cash totals, maintained incrementally by the breakdown lines
+    petty_cash_quantity = fields.Float(
+        string='Petty Cash Quantity',
+        digits=(16, 2),
+        readonly=True,
+        help="Total quantity of the petty cash breakdown lines with a journal entry"
+    )
+    petty_cash_amount = fields.Float(
+        string='Petty Cash Amount',
+        digits=(16, 2),
+        readonly=True,
+        help="Total amount of the petty cash breakdown lines with a journal entry"
+    )
+
     _sql_constraints = [
         ('h_jubran_master_subcategory_code_unique', 'unique(code)', 'Sub-category code must be unique.'),
     ]
 
+    @api.model
+    def _apply_petty_cash_deltas(self, deltas):
+        """Move the petty cash totals by ``{sub-category: (quantity, amount)}``
+
+        Each sub-category is moved by one atomic SQL increment, in ascending
+        id order, and its quantity and rate follow the new totals.
+        """
+        fnames = ['petty_cash_quantity', 'petty_cash_amount', 'quantity', 'rate']
+        self.flush_model(fnames)
+        for subcategory, (delta_quantity, delta_amount) in sorted(deltas.items(), key=lambda item: item[0].id):
+            self.env.cr.execute("""
+                UPDATE h_jubran_master_subcategory
+                   SET petty_cash_quantity = COALESCE(petty_cash_quantity, 0) + %(quantity)s,
+                       petty_cash_amount = COALESCE(petty_cash_amount, 0) + %(amount)s,
+                       quantity = COALESCE(petty_cash_quantity, 0) + %(quantity)s,
+                       -- The sub-category rate is the weighted average of its petty cash
+                       rate = CASE
+                           WHEN COALESCE(petty_cash_quantity, 0) + %(quantity)s > 0
+                           THEN (COALESCE(petty_cash_amount, 0) + %(amount)s)
+                                / (COALESCE(petty_cash_quantity, 0) + %(quantity)s)
+                           ELSE 0 END,
+                       write_uid = %(uid)s,
+                       write_date = NOW() AT TIME ZONE 'UTC'
+                 WHERE id = %(id)s
+            """, {
+                'quantity': delta_quantity,
+                'amount': delta_amount,
+                'uid': self.env.uid,
+                'id': subcategory.id,
+            })
+        subcategories = self.concat(*deltas)
+        subcategories.invalidate_recordset(fnames)
+        subcategories.modified(fnames)
+
+    def _update_from_vendor_bills(self):
+        """Refresh quantity and rate from all the posted vendor bill lines"""
+        totals = {
+            subcategory: (quantity, amount)
+            for subcategory, quantity, amount in self.env['account.move.line']._read_group(
+                [
+                    ('subcategory_id', 'in', self.ids),
+                    ('move_id.move_type', '=', 'in_invoice'),
+                    ('parent_state', '=', 'posted'),
+                    ('display_type', 'in', ['product', False]),
+                ],
+                ['subcategory_id'],
+                ['quantity:sum', 'price_subtotal:sum'],
+            )
+        }
+        # One write per distinct quantity/rate pair
+        by_values = defaultdict(lambda: self.browse())
+        for subcategory in self:
+            quantity, amount = totals.get(subcategory, (0.0, 0.0))
+            weighted_rate = amount / quantity if quantity > 0 else 0.0
+            by_values[(quantity, weighted_rate)] |= subcategory
+        for (quantity, rate), subcategories in by_values.items():
+            subcategories.write({'quantity': quantity, 'rate': rate})
+
 
 class HJubranMasterElement(models.Model):
     _name = 'h_jubran.master.element'
@@ -0,0 +1,83 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from odoo import fields, models, api, tools
+
+_logger = logging.getLogger(__name__)
+
+# Days samples are kept when h_jubran_prd.perf_sample_retention_days is not set
+_DEFAULT_RETENTION_DAYS = 7
+
+
+class HJubranPerfSample(models.Model):
+    _name = 'h_jubran.perf.sample'
+    _description = 'Performance Sample'
+    _order = 'id desc'
+
+    operation = fields.Char(string='Operation', required=True, readonly=True, index=True)
+    phase = fields.Char(string='Phase', required=True, readonly=True)
+    duration_ms = fields.Float(string='Duration (ms)', digits=(16, 2), readonly=True)
+    query_count = fields.Integer(string='SQL Queries', readonly=True)
+    row_count = fields.Integer(
+        string='Rows Touched',
+        readonly=True,
+        help="Number of records read or written by the phase, as reported by the caller."
+    )
+    user_id = fields.Many2one('res.users', string='User', readonly=True)
+
+    def init(self):
+        # The daily prune deletes by age
+        tools.create_index(self.env.cr, 'h_jubran_perf_sample_create_date_index', self._table, ['create_date'])
+
+    @contextmanager
+    def _span(self, operation, phase):
+        """Time a phase of ``operation``, as ``with ..._span(op, phase) as span:``.
+
+        Spans are only recorded when the ``h_jubran_prd.perf_spans`` system
+        parameter is set; the caller reports rows touched with
+        ``span['rows'] = n``. Samples are stored in this table and also
+        emitted as one structured debug log line; they are pruned daily
+        (see ``_gc_perf_samples``). Phases that raise are not recorded.
+        """
+        span = {'rows': 0}
+        if not self.env['ir.config_parameter'].sudo().get_param('h_jubran_prd.perf_spans'):
+            yield span
+            return
+        cr = self.env.cr
+        queries = cr.sql_log_count
+        started = time.perf_counter()
+        yield span
+        # Only successful phases are recorded: after a failed query the
+        # transaction is aborted and the insert would mask the original error
+        duration_ms = (time.perf_counter() - started) * 1000.0
+        query_count = cr.sql_log_count - queries
+        _logger.debug(
+            "perf operation=%s phase=%s duration_ms=%.2f queries=%d rows=%d",
+            operation, phase, duration_ms, query_count, span['rows'],
+        )
+        self.sudo().create({
+            'operation': operation,
+            'phase': phase,
+            'duration_ms': duration_ms,
+            'query_count': query_count,
+            'row_count': span['rows'],
+            'user_id': self.env.uid,
+        })
+
+    @api.autovacuum
+    def _gc_perf_samples(self):
+        """Delete the samples older than the retention period
+
+        The period is the ``h_jubran_prd.perf_sample_retention_days`` system
+        parameter, in days (7 when unset); 0 or less keeps every sample.
+        """
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'h_jubran_prd.perf_sample_retention_days', _DEFAULT_RETENTION_DAYS,
+        ))
+        if days <= 0:
+            return
+        limit_date = fields.Datetime.now() - timedelta(days=days)
+        self.env.cr.execute(f"DELETE FROM {self._table} WHERE create_date < %s", (limit_date,))
+        _logger.info("Pruned %d performance sample(s) older than %d days", self.env.cr.rowcount, days)
@@ -1,7 +1,30 @@
+import json
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
 
+def _write_move_links(lines, move_ids):
+    """Set ``move_id`` of ``lines`` from ``{line id: move id}`` with one UPDATE
+
+    Bypasses ``write``: the caller brings the running totals and BOQ
+    actuals up to date once the links are set.
+    """
+    if not move_ids:
+        return
+    lines.flush_model(['move_id'])
+    lines.env.cr.execute(f"""
+        UPDATE {lines._table} l
+           SET move_id = v.move_id
+          FROM jsonb_to_recordset(%s::jsonb) AS v(id int, move_id int)
+         WHERE l.id = v.id
+    """, (json.dumps([{'id': line_id, 'move_id': move_id} for line_id, move_id in move_ids.items()]),))
+    linked = lines.browse(list(move_ids))
+    linked.invalidate_recordset(['move_id'])
+    linked.modified(['move_id'])
+
+
 class PettyCash(models.Model):
     _name = 'h_jubran.petty.cash'
     _description = 'Petty Cash'
@@ -104,6 +127,17 @@ class PettyCash(models.Model):
         compute='_compute_journal_entry_count'
     )
     
+    post_journal_entries = fields.Boolean(
+        string='Post Journal Entries',
+        help="Post the journal entries created on approval instead of leaving them in draft."
+    )
+    
+    group_journal_entries = fields.Boolean(
+        string='Group Journal Entries',
+        help="Create one journal entry per journal and date, with the lines of all the "
+             "issue and breakdown lines sharing them."
+    )
+    
     @api.depends('issue_line_ids.move_id', 'breakdown_line_ids.move_id')
     def _compute_journal_entry_count(self):
         for record in self:
@@ -141,16 +175,78 @@ class PettyCash(models.Model):
             vals['name'] = self.env['ir.sequence'].next_by_code('h_jubran.petty.cash') or _('New')
         return super().create(vals)
     
+    def write(self, vals):
+        result = super().write(vals)
+        # The breakdown actuals move to the BOQ lines of the new project
+        if 'project_id' in vals:
+            self.breakdown_line_ids._update_running_totals()
+            self.breakdown_line_ids._post_boq_actual_entries()
+        return result
+    
     def action_request_approval(self):
         self.write({'state': 'request_approval'})
     
     def action_approve(self):
         """Approve petty cash and create journal entries for all issue lines"""
         self.write({'state': 'approved'})
-        # Create journal entries for all issue lines
-        for issue_line in self.issue_line_ids:
-            if not issue_line.move_id and issue_line.debit_account_id and issue_line.credit_account_id and issue_line.journal_id:
-                issue_line._create_journal_entry()
+        # Create journal entries for all issue lines (and breakdown lines still without one)
+        issue_lines = self.issue_line_ids.filtered(
+            lambda l: not l.move_id and l.debit_account_id and l.credit_account_id and l.journal_id
+        )
+        breakdown_lines = self.breakdown_line_ids.filtered(
+            lambda l: not l.move_id and l.debit_account_id and l.credit_account_id and l.journal_id
+        )
+        self._create_journal_entries(issue_lines, breakdown_lines)
+        # Catch up the running totals of all the sheets' lines in one pass
+        self.breakdown_line_ids._update_running_totals()
+        self.breakdown_line_ids._post_boq_actual_entries()
+    
+    def _create_journal_entries(self, issue_lines, breakdown_lines):
+        """Create the journal entries of issue and breakdown lines in one batch
+
+        The move values of all the lines are created with a single
+        ``account.move.create``. Sheets with ``group_journal_entries`` get
+        one move per journal and date holding the lines of all their issue
+        and breakdown lines, and the moves of sheets with
+        ``post_journal_entries`` are posted together.
+        """
+        groups = []  # [move vals, issue lines, breakdown lines, post]
+        grouped = {}
+        for line in list(issue_lines) + list(breakdown_lines):
+            move_vals = line._prepare_journal_entry_vals()
+            if not move_vals:
+                continue
+            sheet = line.petty_cash_id
+            key = (sheet.id, move_vals['journal_id'], move_vals['date'])
+            if sheet.group_journal_entries and key in grouped:
+                group = grouped[key]
+                group[0]['line_ids'] += move_vals['line_ids']
+                group[0]['ref'] = _("Petty Cash: %s", sheet.name)
+            else:
+                group = [move_vals, issue_lines.browse(), breakdown_lines.browse(), sheet.post_journal_entries]
+                groups.append(group)
+                if sheet.group_journal_entries:
+                    grouped[key] = group
+            if line._name == issue_lines._name:
+                group[1] |= line
+            else:
+                group[2] |= line
+        if not groups:
+            return self.env['account.move']
+        
+        moves = self.env['account.move'].create([group[0] for group in groups])
+        # Write the links back in one pass per line model
+        issue_links = {}
+        breakdown_links = {}
+        for move, (_vals, issues, breakdowns, _post) in zip(moves, groups):
+            issue_links.update(dict.fromkeys(issues.ids, move.id))
+            breakdown_links.update(dict.fromkeys(breakdowns.ids, move.id))
+        _write_move_links(issue_lines, issue_links)
+        _write_move_links(breakdown_lines, breakdown_links)
+        to_post = moves.browse([move.id for move, group in zip(moves, groups) if group[3]])
+        if to_post:
+            to_post.action_post()
+        return moves
     
     def action_done(self):
         self.write({'state': 'done'})
@@ -276,10 +372,15 @@ class PettyCashIssue(models.Model):
     def _create_journal_entry(self):
         """Create a draft journal entry for approved issue"""
         self.ensure_one()
+        return self.petty_cash_id._create_journal_entries(self, self.env['h_jubran.petty.cash.breakdown'])
+    
+    def _prepare_journal_entry_vals(self):
+        """Return the values of the journal entry of this issue line"""
+        self.ensure_one()
         if not self.debit_account_id or not self.credit_account_id or not self.journal_id:
             raise ValidationError(_("Debit Account, Credit Account, and Journal are required to create journal entry."))
         
-        move_vals = {
+        return {
             'move_type': 'entry',
             'journal_id': self.journal_id.id,
             'date': self.date,
@@ -301,9 +402,6 @@ class PettyCashIssue(models.Model):
                 }),
             ],
         }
-        move = self.env['account.move'].create(move_vals)
-        self.move_id = move.id
-        return move
 
 
 class PettyCashBreakdown(models.Model):
@@ -429,6 +527,22 @@ class PettyCashBreakdown(models.Model):
         help="Journal entry created for this breakdown line"
     )
     
+    # Contribution already added to the petty cash running totals
+    counted_subcategory_id = fields.Many2one(
+        'h_jubran.master.subcategory',
+        string='Counted Sub-Category',
+        readonly=True,
+        copy=False
+    )
+    counted_project_id = fields.Many2one(
+        'h_jubran.project',
+        string='Counted Project',
+        readonly=True,
+        copy=False
+    )
+    counted_quantity = fields.Float(string='Counted Quantity', digits=(16, 2), readonly=True, copy=False)
+    counted_amount = fields.Float(string='Counted Amount', digits=(16, 2), readonly=True, copy=False)
+    
     state = fields.Selection([
         ('draft', 'Draft'),
         ('approved', 'Approved'),
@@ -448,31 +562,69 @@ class PettyCashBreakdown(models.Model):
         for line in self:
             line.status = dict(self._fields['state'].selection).get(line.state, '')
     
-    @api.model
-    def create(self, vals):
-        record = super().create(vals)
-        # Create journal entry and update subcategory when breakdown is created
-        if record.debit_account_id and record.credit_account_id and record.journal_id:
-            record._create_journal_entry()
-        if record.subcategory_id:
-            record._update_subcategory_amounts()
-        return record
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Journal entries are created in one batch when the sheet is approved;
+        # lines added to an approved sheet get theirs right away
+        records._create_approved_journal_entries()
+        return records
     
     def write(self, vals):
         result = super().write(vals)
-        # Create journal entry if not exists and accounts are set
-        for record in self:
-            if not record.move_id and record.debit_account_id and record.credit_account_id and record.journal_id:
-                record._create_journal_entry()
-            # Update subcategory if subcategory or amount changed
-            if 'subcategory_id' in vals or 'amount' in vals or 'quantity' in vals or 'rate' in vals:
-                if record.subcategory_id:
-                    record._update_subcategory_amounts()
+        self._create_approved_journal_entries()
+        # Update the totals in one pass if the counted contribution may have changed
+        if {'move_id', 'subcategory_id', 'quantity', 'amount', 'petty_cash_id'}.intersection(vals):
+            self._update_running_totals()
+            self._post_boq_actual_entries()
         return result
     
+    def unlink(self):
+        self.env['h_jubran.boq.actual.entry']._sync_source(
+            'h_jubran.petty.cash.breakdown', {line.id: {} for line in self}
+        )
+        self._update_running_totals(removed=True)
+        return super().unlink()
+    
+    def _post_boq_actual_entries(self):
+        """Post the BOQ actual entries of the breakdown lines that have a journal entry"""
+        desired = {}
+        for line in self:
+            project = line.petty_cash_id.project_id
+            if line.move_id and line.subcategory_id and project:
+                desired[line.id] = {(project.id, line.subcategory_id.id): (line.quantity, line.amount)}
+            else:
+                desired[line.id] = {}
+        self.env['h_jubran.boq.actual.entry']._sync_source('h_jubran.petty.cash.breakdown', desired)
+    
+    def _create_approved_journal_entries(self):
+        """Create the missing journal entries of the lines of approved sheets
+
+        Goes through the sheets' batch path, then brings the running totals
+        and BOQ actuals of the lines that got one up to date. Returns those
+        lines.
+        """
+        to_create = self.filtered(
+            lambda r: r.petty_cash_id.state in ('approved', 'done')
+            and not r.move_id and r.debit_account_id and r.credit_account_id and r.journal_id
+        )
+        if not to_create:
+            return to_create
+        to_create.petty_cash_id._create_journal_entries(self.env['h_jubran.petty.cash.issue'], to_create)
+        created = to_create.filtered('move_id')
+        created._update_running_totals()
+        created._post_boq_actual_entries()
+        return created
+
     def _create_journal_entry(self):
         """Create a journal entry for breakdown line"""
         self.ensure_one()
+        # The caller updates the running totals for all its lines at once
+        return self.petty_cash_id._create_journal_entries(self.env['h_jubran.petty.cash.issue'], self)
+    
+    def _prepare_journal_entry_vals(self):
+        """Return the values of the journal entry of this breakdown line"""
+        self.ensure_one()
         if not self.debit_account_id or not self.credit_account_id or not self.journal_id:
             return False
         
@@ -481,7 +633,7 @@ class PettyCashBreakdown(models.Model):
         if amount <= 0:
             return False
         
-        move_vals = {
+        return {
             'move_type': 'entry',
             'journal_id': self.journal_id.id,
             'date': self.request_date,
@@ -503,58 +655,62 @@ class PettyCashBreakdown(models.Model):
                 }),
             ],
         }
-        move = self.env['account.move'].create(move_vals)
-        self.move_id = move.id
-        return move
     
-    def _update_subcategory_amounts(self):
-        """Update subcategory quantity and rate similar to vendor bills"""
-        self.ensure_one()
-        if not self.subcategory_id:
-            return
-        
-        # Get all petty cash breakdown lines for this subcategory
-        all_breakdown_lines = self.env['h_jubran.petty.cash.breakdown'].search([
-            ('subcategory_id', '=', self.subcategory_id.id),
-            ('move_id', '!=', False),  # Only count lines with journal entries
-        ])
-        
-        # Calculate total quantity and amount
-        total_quantity = sum(all_breakdown_lines.mapped('quantity'))
-        total_amount = sum(all_breakdown_lines.mapped('amount'))
-        
-        # Calculate weighted average rate
-        weighted_rate = total_amount / total_quantity if total_quantity > 0 else 0.0
-        
-        # Update subcategory
-        self.subcategory_id.write({
-            'quantity': total_quantity,
-            'rate': weighted_rate
-        })
+    def _update_running_totals(self, removed=False):
+        """Move the petty cash running totals by the change of these lines' contribution
+
+        A line counts towards its sub-category (and project) totals once it
+        has a journal entry. The contribution already counted is kept on the
+        line, so only the difference is applied, in one pass for all lines,
+        and the new contributions are stored with one UPDATE. ``removed``
+        takes the lines out of the totals before they are deleted.
+        """
+        subcategory_deltas = defaultdict(lambda: [0.0, 0.0])
+        project_deltas = defaultdict(lambda: [0.0, 0.0])
+        counted = []
+        for line in self:
+            if line.move_id and line.subcategory_id and not removed:
+                new = (line.subcategory_id, line.petty_cash_id.project_id, line.quantity or 0.0, line.amount or 0.0)
+            else:
+                new = (line.subcategory_id.browse(), line.petty_cash_id.project_id.browse(), 0.0, 0.0)
+            old = (line.counted_subcategory_id, line.counted_project_id, line.counted_quantity, line.counted_amount)
+            if new == old:
+                continue
+            for sign, (subcategory, project, quantity, amount) in ((-1, old), (1, new)):
+                if not subcategory:
+                    continue
+                subcategory_deltas[subcategory][0] += sign * quantity
+                subcategory_deltas[subcategory][1] += sign * amount
+                if project:
+                    project_deltas[(project, subcategory)][0] += sign * quantity
+                    project_deltas[(project, subcategory)][1] += sign * amount
+            if not removed:
+                counted.append({
+                    'id': line.id,
+                    'subcategory_id': new[0].id or None,
+                    'project_id': new[1].id or None,
+                    'quantity': new[2],
+                    'amount': new[3],
+                })
         
-        # Update BOQ Summary Lines if project is set
-        if self.petty_cash_id.project_id:
-            boq_lines = self.env['h_jubran.boq.summary.line'].search([
-                ('summary_id.project_id', '=', self.petty_cash_id.project_id.id),
-                ('subcategory_id', '=', self.subcategory_id.id)
-            ])
-            
-            if boq_lines:
-                # Get all breakdown lines for this project + subcategory
-                project_breakdown_lines = all_breakdown_lines.filtered(
-                    lambda l: l.petty_cash_id.project_id.id == self.petty_cash_id.project_id.id
-                )
-                
-                project_total_quantity = sum(project_breakdown_lines.mapped('quantity'))
-                project_total_amount = sum(project_breakdown_lines.mapped('amount'))
-                project_weighted_rate = project_total_amount / project_total_quantity if project_total_quantity > 0 else 0.0
-                
-                for boq_line in boq_lines:
-                    boq_line.write({
-                        'actual_quantity': project_total_quantity,
-                        'actual_rate': project_weighted_rate,
-                        'actual_amount': project_total_amount
-                    })
+        if counted:
+            counted_fnames = ['counted_subcategory_id', 'counted_project_id', 'counted_quantity', 'counted_amount']
+            self.flush_recordset(counted_fnames)
+            self.env.cr.execute("""
+                UPDATE h_jubran_petty_cash_breakdown b
+                   SET counted_subcategory_id = c.subcategory_id,
+                       counted_project_id = c.project_id,
+                       counted_quantity = c.quantity,
+                       counted_amount = c.amount
+                  FROM jsonb_to_recordset(%s::jsonb)
+                       AS c(id int, subcategory_id int, project_id int, quantity numeric, amount numeric)
+                 WHERE b.id = c.id
+            """, (json.dumps(counted),))
+            self.browse([vals['id'] for vals in counted]).invalidate_recordset(counted_fnames)
+        if subcategory_deltas:
+            self.env['h_jubran.master.subcategory']._apply_petty_cash_deltas(subcategory_deltas)
+        if project_deltas:
+            self.env['h_jubran.petty.cash.total']._apply_deltas(project_deltas)
     
     @api.onchange('subcategory_id')
     def _onchange_subcategory_id(self):
@@ -583,3 +739,109 @@ class PettyCashBreakdown(models.Model):
         if self.amount and not self.request_amount:
             self.request_amount = self.amount
 
+
+class PettyCashTotal(models.Model):
+    _name = 'h_jubran.petty.cash.total'
+    _description = 'Petty Cash Project Sub-Category Total'
+    _order = 'project_id, subcategory_id'
+
+    project_id = fields.Many2one(
+        'h_jubran.project',
+        string='Project',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    subcategory_id = fields.Many2one(
+        'h_jubran.master.subcategory',
+        string='Sub-Category',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    quantity = fields.Float(string='Quantity', digits=(16, 2), readonly=True)
+    amount = fields.Float(string='Amount', digits=(16, 2), readonly=True)
+
+    _sql_constraints = [
+        (
+            'project_subcategory_unique',
+            'unique(project_id, subcategory_id)',
+            'There is one petty cash total per project and sub-category.'
+        ),
+    ]
+
+    def init(self):
+        # One-time backfill of the running totals from the existing lines
+        cr = self.env.cr
+        cr.execute("""
+            SELECT 1 FROM h_jubran_petty_cash_breakdown WHERE counted_subcategory_id IS NOT NULL
+            UNION ALL
+            SELECT 1 FROM h_jubran_petty_cash_total
+            LIMIT 1
+        """)
+        if cr.fetchone():
+            return
+        cr.execute("""
+            UPDATE h_jubran_petty_cash_breakdown b
+               SET counted_subcategory_id = b.subcategory_id,
+                   counted_project_id = pc.project_id,
+                   counted_quantity = COALESCE(b.quantity, 0),
+                   counted_amount = COALESCE(b.amount, 0)
+              FROM h_jubran_petty_cash pc
+             WHERE pc.id = b.petty_cash_id
+               AND b.move_id IS NOT NULL
+               AND b.subcategory_id IS NOT NULL
+        """)
+        cr.execute("""
+            UPDATE h_jubran_master_subcategory s
+               SET petty_cash_quantity = t.quantity,
+                   petty_cash_amount = t.amount
+              FROM (
+                    SELECT counted_subcategory_id AS id,
+                           SUM(counted_quantity) AS quantity,
+                           SUM(counted_amount) AS amount
+                      FROM h_jubran_petty_cash_breakdown
+                     WHERE counted_subcategory_id IS NOT NULL
+                  GROUP BY counted_subcategory_id
+                   ) t
+             WHERE t.id = s.id
+        """)
+        cr.execute("""
+            INSERT INTO h_jubran_petty_cash_total (project_id, subcategory_id, quantity, amount)
+                 SELECT counted_project_id, counted_subcategory_id, SUM(counted_quantity), SUM(counted_amount)
+                   FROM h_jubran_petty_cash_breakdown
+                  WHERE counted_project_id IS NOT NULL
+               GROUP BY counted_project_id, counted_subcategory_id
+        """)
+
+    @api.model
+    def _apply_deltas(self, deltas):
+        """Move the totals by ``{(project, sub-category): (quantity, amount)}``
+
+        Each key is moved by one atomic upsert, in ascending key order, so
+        concurrent approvals on the same project add up instead of
+        overwriting each other's totals.
+        """
+        self.flush_model(['quantity', 'amount'])
+        for (project, subcategory), (delta_quantity, delta_amount) in sorted(
+            deltas.items(), key=lambda item: (item[0][0].id, item[0][1].id)
+        ):
+            self.env.cr.execute("""
+                INSERT INTO h_jubran_petty_cash_total
+                            (project_id, subcategory_id, quantity, amount,
+                             create_uid, create_date, write_uid, write_date)
+                     VALUES (%(project_id)s, %(subcategory_id)s, %(quantity)s, %(amount)s,
+                             %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC')
+                ON CONFLICT (project_id, subcategory_id) DO UPDATE
+                        SET quantity = COALESCE(h_jubran_petty_cash_total.quantity, 0) + EXCLUDED.quantity,
+                            amount = COALESCE(h_jubran_petty_cash_total.amount, 0) + EXCLUDED.amount,
+                            write_uid = EXCLUDED.write_uid,
+                            write_date = EXCLUDED.write_date
+            """, {
+                'project_id': project.id,
+                'subcategory_id': subcategory.id,
+                'quantity': delta_quantity,
+                'amount': delta_amount,
+                'uid': self.env.uid,
+            })
+        self.invalidate_model(['quantity', 'amount'])
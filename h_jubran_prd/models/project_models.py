@@ -3,6 +3,33 @@ from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 
 
+# Cursor cache key of the stage ids per project, see _get_project_stage_ids()
+_PROJECT_STAGES_CACHE_KEY = 'h_jubran_project_stage_ids'
+
+
+def _project_stage_cache(cr):
+    """Return the project stage cache of this transaction, None once disabled
+
+    The entry is dropped when the transaction commits or rolls back, so
+    the next transaction reads the stages again.
+    """
+    if _PROJECT_STAGES_CACHE_KEY not in cr.cache:
+        cr.cache[_PROJECT_STAGES_CACHE_KEY] = {}
+        cr.postcommit.add(lambda: cr.cache.pop(_PROJECT_STAGES_CACHE_KEY, None))
+        cr.postrollback.add(lambda: cr.cache.pop(_PROJECT_STAGES_CACHE_KEY, None))
+    return cr.cache[_PROJECT_STAGES_CACHE_KEY]
+
+
+def _disable_project_stage_cache(cr):
+    """Stop caching project stages until the end of this transaction
+
+    Stage lines changed in the transaction may still be rolled back to a
+    savepoint, so the stages are read from the database from now on.
+    """
+    _project_stage_cache(cr)
+    cr.cache[_PROJECT_STAGES_CACHE_KEY] = None
+
+
 class H_JubranProject(models.Model):
     _name = 'h_jubran.project'
     _inherit = ['mail.thread', 'mail.activity.mixin']
@@ -50,7 +77,45 @@ class H_JubranProject(models.Model):
     progress = fields.Float(
         string='Overall Progress (%)',
         compute='_compute_overall_progress',
-        store=True
+        store=True,
+        index=True
+    )
+
+    # === Cost Rollups (stored, recomputed only for the projects that changed) ===
+    budgeted_cost = fields.Monetary(
+        string='Budgeted Cost',
+        currency_field='currency_id',
+        compute='_compute_budgeted_cost',
+        store=True,
+        help="Planned amount of all the BOQ summaries of the project."
+    )
+    committed_cost = fields.Monetary(
+        string='Committed Cost',
+        currency_field='currency_id',
+        readonly=True,
+        copy=False,
+        help="Part of the actual cost still open on confirmed purchase orders, i.e. not billed yet."
+    )
+    actual_cost = fields.Monetary(
+        string='Actual Cost',
+        currency_field='currency_id',
+        readonly=True,
+        copy=False,
+        help="Open purchase orders, posted vendor bills and petty cash of the project, the same total as its BOQ line actuals."
+    )
+    cost_variance = fields.Monetary(
+        string='Cost Variance',
+        currency_field='currency_id',
+        compute='_compute_cost_variance',
+        store=True,
+        help="Budgeted cost minus actual cost; negative when the project is over budget."
+    )
+    is_overspent = fields.Boolean(
+        string='Overspent',
+        compute='_compute_cost_variance',
+        store=True,
+        index=True,
+        help="The actual cost, open purchase orders included, exceeds the budgeted cost."
     )
 
     attachment_ids = fields.Many2many(
@@ -89,6 +154,13 @@ class H_JubranProject(models.Model):
         'project_id',
         string='BOQ Summaries'
     )
+    boq_rate_version = fields.Integer(
+        string='BOQ Rate Version',
+        default=0,
+        readonly=True,
+        copy=False,
+        help="Incremented whenever the BOQ rates of the project change; part of the rate cache key."
+    )
     boq_summary_count = fields.Integer(
         string='BOQ Summary Count',
         compute='_compute_boq_summary_count'
@@ -97,12 +169,37 @@ class H_JubranProject(models.Model):
     # === Computed Fields ===
     @api.depends('stage_line_ids.progress')
     def _compute_overall_progress(self):
+        progress = dict(self.env['h_jubran.project.stage.line']._read_group(
+            [('project_id', 'in', self.ids)], ['project_id'], ['progress:avg'],
+        )) if self.ids else {}
+        for project in self:
+            project.progress = progress.get(project._origin, 0.0)
+
+    @api.depends('boq_summary_ids.total_amount')
+    def _compute_budgeted_cost(self):
+        totals = self._sum_by_project(
+            'h_jubran.boq.summary', [], 'total_amount',
+        )
         for project in self:
-            if not project.stage_line_ids:
-                project.progress = 0.0
-            else:
-                total = sum(stage.progress for stage in project.stage_line_ids)
-                project.progress = total / len(project.stage_line_ids)
+            project.budgeted_cost = totals.get(project._origin, 0.0)
+
+    @api.depends('budgeted_cost', 'actual_cost')
+    def _compute_cost_variance(self):
+        for project in self:
+            project.cost_variance = project.budgeted_cost - project.actual_cost
+            currency = project.currency_id or self.env.company.currency_id
+            project.is_overspent = bool(project.budgeted_cost) and currency.compare_amounts(
+                project.actual_cost, project.budgeted_cost
+            ) > 0
+
+    def _sum_by_project(self, model, domain, field_name):
+        """Return ``{project: sum of field_name}`` over the records of ``model``
+        matching ``domain``, read with one grouped query for all of ``self``"""
+        if not self.ids:
+            return {}
+        return dict(self.env[model]._read_group(
+            [('project_id', 'in', self.ids)] + domain, ['project_id'], [f'{field_name}:sum'],
+        ))
 
     # === Core Logic ===
     # @api.model
@@ -251,11 +348,7 @@ class H_JubranProjectStageLine(models.Model):
     #     string='Linked Tasks'
     # )
 
-    progress = fields.Float(
-        string='Stage Progress (%)',
-        compute='_compute_stage_progress',
-        store=True
-    )
+    progress = fields.Float(string='Stage Progress (%)')
 
     state = fields.Selection([
         ('not_started', 'Not Started'),
@@ -263,6 +356,41 @@ class H_JubranProjectStageLine(models.Model):
         ('completed', 'Completed'),
     ], string='Stage Status', default='not_started')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        _disable_project_stage_cache(self.env.cr)
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if 'project_id' in vals or 'stage_id' in vals:
+            _disable_project_stage_cache(self.env.cr)
+        return super().write(vals)
+
+    def unlink(self):
+        _disable_project_stage_cache(self.env.cr)
+        return super().unlink()
+
+    @api.model
+    def _get_project_stage_ids(self, project_ids):
+        """Return ``{project_id: [stage ids]}`` for the given projects
+
+        The stages of all projects not yet known in the current transaction
+        are read with one grouped query; the result is kept in the cursor
+        cache until the transaction ends or a project stage line is
+        created, changed or deleted in it.
+        """
+        cache = _project_stage_cache(self.env.cr)
+        if cache is None:
+            cache = {}
+        missing = [project_id for project_id in set(project_ids) if project_id not in cache]
+        if missing:
+            cache.update(dict.fromkeys(missing, []))
+            for project, stage_ids in self._read_group(
+                [('project_id', 'in', missing)], ['project_id'], ['stage_id:array_agg'],
+            ):
+                cache[project.id] = sorted(set(stage_ids))
+        return {project_id: cache[project_id] for project_id in project_ids}
+
     # @api.depends('element_ids.progress')
     # def _compute_stage_progress(self):
     #     for stage in self:
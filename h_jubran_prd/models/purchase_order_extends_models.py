@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
@@ -47,6 +49,7 @@ class PurchaseOrder(models.Model):
         'h_jubran.purchase.request',
         string='Auto Complete PR',
         domain="[('state', '=', 'done'), ('used_in_confirmed_po', '=', False)]",
+        index='btree_not_null',
         help="Select a Purchase Request to automatically populate purchase order lines. Only shows Purchase Requests in 'Done' state that haven't been used in confirmed Purchase Orders."
     )
     
@@ -174,32 +177,46 @@ class PurchaseOrder(models.Model):
             self.project_site = False
     
     def write(self, vals):
-        """Override write to recompute used_in_confirmed_po when PO state changes"""
+        """Override write to post the BOQ actuals when the PO state changes
+
+        ``used_in_confirmed_po`` of the linked Purchase Request follows the
+        state through its dependency on ``purchase_order_ids.state``.
+        """
         result = super().write(vals)
-        # If state is changing to 'purchase' or 'done', recompute PRs
-        if 'state' in vals and vals['state'] in ['purchase', 'done']:
-            # Recompute all PRs in 'done' state to ensure the field is up to date
-            all_prs = self.env['h_jubran.purchase.request'].search([('state', '=', 'done')])
-            if all_prs:
-                all_prs.sudo()._compute_used_in_confirmed_po()
+        # Confirm, cancel and reset to draft post or reverse the BOQ actuals
+        if 'state' in vals or 'project_id' in vals:
+            self._post_boq_actual_entries()
         return result
     
-    def button_confirm(self):
-        """Override to update BOQ actual costs when PO is confirmed and mark PR as used"""
-        result = super().button_confirm()
-        # Update BOQ lines for all PO lines with subcategory
-        for line in self.order_line:
-            if line.subcategory_id and line.project_id:
-                line._update_boq_actual_costs()
-        
-        # Recompute used_in_confirmed_po for all PRs that might be affected
-        # This ensures the field is updated when PO state changes to 'purchase' or 'done'
-        # Recompute all PRs in 'done' state to ensure the field is up to date
-        all_prs = self.env['h_jubran.purchase.request'].search([('state', '=', 'done')])
-        if all_prs:
-            all_prs.sudo()._compute_used_in_confirmed_po()
-        
-        return result
+    def _post_boq_actual_entries(self):
+        """Post the BOQ actual entries standing for the current lines of these orders
+
+        A confirmed order stands for the part of its lines not billed yet,
+        at the order's unit price: the posted vendor bills of a line carry
+        the rest of its cost, so billing moves the actuals from the order to
+        the bill instead of counting them twice. Bills re-post the orders
+        they invoice when their state changes.
+        """
+        desired = {}
+        for order in self:
+            wanted = defaultdict(lambda: [0.0, 0.0])
+            if order.state in ['purchase', 'done'] and order.project_id:
+                for line in order.order_line:
+                    if not line.subcategory_id:
+                        continue
+                    quantity = max((line.product_qty or 0.0) - line._get_boq_billed_qty(), 0.0)
+                    # Manual lines without a subtotal count at their unit price
+                    if line.price_subtotal and line.product_qty:
+                        price_unit = line.price_subtotal / line.product_qty
+                    else:
+                        price_unit = line.price_unit or 0.0
+                    totals = wanted[(order.project_id.id, line.subcategory_id.id)]
+                    totals[0] += quantity
+                    totals[1] += quantity * price_unit
+            desired[order.id] = wanted
+        self.env['h_jubran.boq.actual.entry']._sync_source('purchase.order', desired)
+        self.order_line._sync_boq_purchase_links()
+
 
 # --- Purchase Order Line Extension ---
 
@@ -331,71 +348,79 @@ class PurchaseOrderLine(models.Model):
         self.substage_id = False
         self.element_id = False
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        boq_line_model = self.env['h_jubran.boq.summary.line']
+        orders = {
+            order.id: order
+            for order in self.env['purchase.order'].browse(
+                [vals['order_id'] for vals in vals_list if vals.get('order_id')]
+            )
+        }
+        for vals in vals_list:
+            # Lines entered by hand get the BOQ rate of their project too
+            if vals.get('subcategory_id') and not vals.get('boq_rate') and vals.get('order_id'):
+                vals['boq_rate'] = boq_line_model._get_boq_rate(
+                    orders[vals['order_id']].project_id.id,
+                    vals['subcategory_id'],
+                    vals.get('category_id'),
+                )
+        lines = super().create(vals_list)
+        # Lines added to an already confirmed order
+        lines.order_id.filtered(lambda o: o.state in ['purchase', 'done'])._post_boq_actual_entries()
+        return lines
+
     def _update_boq_actual_costs(self):
         """Update BOQ Summary Line actual costs when PO is confirmed"""
-        for line in self:
-            # Skip if no subcategory or project
-            if not line.subcategory_id or not line.project_id:
-                continue
-            
-            # If no product, use manual quantity/rate from line
-            if not line.product_id:
-                # Use manual values if product_qty and price_unit are set manually
-                po_quantity = line.product_qty or 0.0
-                po_rate = line.price_unit or 0.0
-                po_amount = line.price_subtotal or (po_quantity * po_rate)
-            else:
-                # Use standard product values
-                po_quantity = line.product_qty
-                po_rate = line.price_unit
-                po_amount = line.price_subtotal
-            
-            # Find matching BOQ Summary Lines: same project and subcategory
-            boq_lines = self.env['h_jubran.boq.summary.line'].search([
-                ('summary_id.project_id', '=', line.project_id.id),
-                ('subcategory_id', '=', line.subcategory_id.id)
-            ])
-            
-            if not boq_lines:
+        self.order_id._post_boq_actual_entries()
+
+    def _get_boq_billed_qty(self):
+        """Quantity of this line on posted vendor bills, in the line's unit of measure"""
+        self.ensure_one()
+        billed = 0.0
+        for invoice_line in self.invoice_lines:
+            move = invoice_line.move_id
+            if move.state != 'posted' or move.move_type != 'in_invoice':
                 continue
-            
-            # For each matching BOQ line, aggregate values from all PO lines with same subcategory
-            for boq_line in boq_lines:
-                # Get all PO lines that match this BOQ line (same project + subcategory)
-                all_matching_po_lines = self.env['purchase.order.line'].search([
-                    ('subcategory_id', '=', line.subcategory_id.id),
-                    ('order_id.project_id', '=', line.project_id.id),
-                    ('order_id.state', 'in', ['purchase', 'done']),
-                    ('id', '!=', False)  # Exclude deleted lines
-                ])
-                
-                # Calculate aggregated values: sum quantities and amounts, weighted average rate
-                # Handle both product-based and manual PO lines
-                total_quantity = 0.0
-                total_amount = 0.0
-                for po_line in all_matching_po_lines:
-                    qty = po_line.product_qty or 0.0
-                    amount = po_line.price_subtotal or (qty * (po_line.price_unit or 0.0))
-                    total_quantity += qty
-                    total_amount += amount
-                
-                weighted_rate = total_amount / total_quantity if total_quantity > 0 else 0.0
-                
-                # Update BOQ line actual values and track all PO lines
-                boq_line.write({
-                    'actual_quantity': total_quantity,
-                    'actual_rate': weighted_rate,
-                    'actual_amount': total_amount,
-                    'purchase_order_line_ids': [(6, 0, all_matching_po_lines.ids)]  # Replace with all matching PO lines
-                })
-    
+            quantity = invoice_line.quantity or 0.0
+            if invoice_line.product_uom_id and self.product_uom and invoice_line.product_uom_id != self.product_uom:
+                quantity = invoice_line.product_uom_id._compute_quantity(quantity, self.product_uom)
+            billed += quantity
+        return billed
+
+    def _sync_boq_purchase_links(self):
+        """Link confirmed lines to the BOQ lines they cost against, unlink the others
+
+        The link commands of every BOQ line are built first; BOQ lines that
+        need the same commands (typically all the lines of a key) are then
+        written together, one write per distinct set of commands.
+        """
+        confirmed_ids_by_key = defaultdict(set)
+        for line in self:
+            if line.order_id.state in ['purchase', 'done'] and line.subcategory_id and line.project_id:
+                confirmed_ids_by_key[(line.project_id.id, line.subcategory_id.id)].add(line.id)
+        ledger = self.env['h_jubran.boq.actual.entry']
+        boq_lines = self.env['h_jubran.boq.summary.line'].search([('purchase_order_line_ids', 'in', self.ids)])
+        for key_lines in ledger._get_boq_lines(set(confirmed_ids_by_key)).values():
+            boq_lines |= key_lines
+        boq_lines_by_commands = defaultdict(lambda: self.env['h_jubran.boq.summary.line'])
+        for boq_line in boq_lines:
+            wanted = confirmed_ids_by_key.get((boq_line.summary_id.project_id.id, boq_line.subcategory_id.id), set())
+            linked = set(boq_line.purchase_order_line_ids.ids).intersection(self.ids)
+            commands = tuple(
+                [(4, line_id) for line_id in sorted(wanted - linked)]
+                + [(3, line_id) for line_id in sorted(linked - wanted)]
+            )
+            if commands:
+                boq_lines_by_commands[commands] |= boq_line
+        for commands, lines in boq_lines_by_commands.items():
+            lines.write({'purchase_order_line_ids': list(commands)})
+
     def write(self, vals):
         """Override write to update BOQ when PO line changes"""
         result = super().write(vals)
         # Update BOQ if PO is confirmed and subcategory/project/quantities changed
-        if self.order_id.state in ['purchase', 'done']:
-            relevant_fields = {'subcategory_id', 'product_qty', 'price_unit', 'price_subtotal'}
-            if relevant_fields.intersection(vals.keys()):
-                self._update_boq_actual_costs()
+        relevant_fields = {'subcategory_id', 'product_qty', 'price_unit', 'price_subtotal'}
+        if relevant_fields.intersection(vals):
+            self.order_id.filtered(lambda o: o.state in ['purchase', 'done'])._post_boq_actual_entries()
         return result
-    
\ No newline at end of file
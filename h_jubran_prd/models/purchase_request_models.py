@@ -288,14 +288,33 @@ class PurchaseRequest(models.Model):
     
     line_count = fields.Integer(string="Lines", compute="_compute_line_count")
     
-    @api.depends()
+    purchase_order_ids = fields.One2many(
+        'purchase.order',
+        'auto_complete_pr_id',
+        string='Purchase Orders',
+        readonly=True,
+        help="Purchase Orders auto-completed from this Purchase Request"
+    )
+    
+    @api.depends('purchase_order_ids', 'purchase_order_ids.state')
     def _compute_used_in_confirmed_po(self):
         """Check if this Purchase Request has been used in any confirmed Purchase Order"""
-        # Get all PRs that have been used in confirmed POs
-        used_pr_ids = self.env['purchase.order'].search([
-            ('state', 'in', ['purchase', 'done']),
-            ('auto_complete_pr_id', '!=', False)
-        ]).mapped('auto_complete_pr_id').ids
+        pr_ids = tuple(rec.id for rec in self if isinstance(rec.id, int))
+        used_pr_ids = set()
+        if pr_ids:
+            self.env['purchase.order'].flush_model(['auto_complete_pr_id', 'state'])
+            self.env.cr.execute("""
+                SELECT pr.id
+                  FROM h_jubran_purchase_request pr
+                 WHERE pr.id IN %s
+                   AND EXISTS (
+                        SELECT 1
+                          FROM purchase_order po
+                         WHERE po.auto_complete_pr_id = pr.id
+                           AND po.state IN ('purchase', 'done')
+                   )
+            """, (pr_ids,))
+            used_pr_ids = {row[0] for row in self.env.cr.fetchall()}
         
         for rec in self:
             rec.used_in_confirmed_po = rec.id in used_pr_ids
@@ -306,21 +325,6 @@ class PurchaseRequest(models.Model):
         store=True,
         help="True if this Purchase Request has been used in a confirmed Purchase Order"
     )
-    
-    @api.model
-    def _search_not_used_in_confirmed_po(self, operator, value):
-        """Search domain for Purchase Requests not used in confirmed POs"""
-        if operator == '=' and value is False:
-            # Find PRs that are NOT used in confirmed POs
-            # Get all PRs that have lines linked to confirmed PO lines
-            used_pr_ids = self.env['purchase.order.line'].search([
-                ('order_id.state', 'in', ['purchase', 'done']),
-                ('purchase_lines', '!=', False)
-            ]).mapped('purchase_lines.request_id').ids
-            
-            # Return domain to exclude these PRs
-            return [('id', 'not in', used_pr_ids)]
-        return []
 
 
 class PurchaseRequestLine(models.Model):
@@ -454,33 +458,18 @@ class PurchaseRequestLine(models.Model):
 
     @api.depends('project_id', 'category_id', 'subcategory_id', 'request_id.project_id')
     def _compute_boq_rate(self):
-        """Compute BOQ rate from BOQ summary based on project, category, and subcategory."""
+        """Compute BOQ rate from BOQ summary based on project, category, and subcategory.
+
+        Rates come from the cached per-project lookup of the BOQ lines, so
+        a batch of lines only loads each project's BOQ once.
+        """
+        boq_line_model = self.env['h_jubran.boq.summary.line']
         for line in self:
-            line.boq_rate = 0.0
-            project_id = line.project_id.id if line.project_id else (line.request_id.project_id.id if line.request_id and line.request_id.project_id else False)
-            if not project_id or not line.subcategory_id:
-                continue
-            
-            # Find BOQ summary for this project
-            boq_summary = self.env['h_jubran.boq.summary'].search([
-                ('project_id', '=', project_id)
-            ], limit=1)
-            
-            if not boq_summary:
-                continue
-            
-            # Find BOQ summary line matching category and subcategory
-            domain = [
-                ('summary_id', '=', boq_summary.id),
-                ('subcategory_id', '=', line.subcategory_id.id)
-            ]
-            if line.category_id:
-                domain.append(('category_id', '=', line.category_id.id))
-            
-            boq_line = self.env['h_jubran.boq.summary.line'].search(domain, limit=1)
-            
-            if boq_line and boq_line.rate:
-                line.boq_rate = boq_line.rate
+            line.boq_rate = boq_line_model._get_boq_rate(
+                (line.project_id or line.request_id.project_id).id,
+                line.subcategory_id.id,
+                line.category_id.id,
+            )
     
     @api.onchange('subcategory_id')
     def _onchange_subcategory_id(self):
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+
+from odoo import fields
+
+_logger = logging.getLogger(__name__)
+
+_SCOPES = (
+    'Substructure', 'Superstructure', 'Finishes', 'Fittings and Furnishings',
+    'Services', 'External Works', 'Preliminaries', 'Contingencies',
+)
+
+
+class PerfDataGenerator:
+    """Synthetic BOQ and procurement data for the benchmarks
+
+    A test helper rather than a model, so that it is never registered in
+    production databases.
+    """
+
+    def __init__(self, env):
+        self.env = env.with_context(tracking_disable=True, mail_notrack=True, mail_create_nolog=True)
+
+    def generate(self, projects=1, boq_lines=100, document_lines=10, seed=0, confirm=False):
+        """Create a reproducible BOQ and procurement data set for benchmarks.
+
+        Each of the ``projects`` projects gets a BOQ summary of ``boq_lines``
+        lines and one purchase request, purchase order, vendor bill and petty
+        cash sheet of ``document_lines`` lines each, all on the same random
+        sub-categories. The same ``seed`` always produces the same values;
+        codes carry the seed so that several data sets can coexist. Every
+        model is created with one batched create. With ``confirm`` the
+        orders are confirmed, the bills posted and the petty cash approved,
+        otherwise they are left in draft for the caller to process.
+
+        Returns a dict of the created records per kind.
+        """
+        rng = random.Random(seed)
+        prefix = f'PERF{seed}'
+        data = self._generate_master_data(prefix)
+        data['partner'] = self.env['res.partner'].create({
+            'name': f'{prefix} Vendor',
+            'is_company': True,
+            'supplier_rank': 1,
+        })
+        data['product'] = self.env['product.product'].create({
+            'name': f'{prefix} Material',
+            'type': 'consu',
+            'purchase_ok': True,
+            'standard_price': 10.0,
+            'seller_ids': [fields.Command.create({'partner_id': data['partner'].id})],
+        })
+        data['projects'] = self.env['h_jubran.project'].create([{
+            'name': f'{prefix} Project {index}',
+            'start_date': fields.Date.to_date('2025-01-01'),
+        } for index in range(projects)])
+        # Documents use the sub-categories of the BOQ so that actuals land on it
+        subcategories = data['subcategories']
+        keys = {
+            project: [rng.choice(subcategories) for _index in range(document_lines)]
+            for project in data['projects']
+        }
+        data['summaries'] = self._generate_boq(data, rng, boq_lines)
+        data['requests'] = self._generate_purchase_requests(data, rng, keys)
+        data['orders'] = self._generate_purchase_orders(data, rng, keys)
+        data['bills'] = self._generate_vendor_bills(data, rng, keys)
+        data['petty_cash'] = self._generate_petty_cash(data, rng, keys)
+        if confirm:
+            data['orders'].button_confirm()
+            data['bills'].action_post()
+            data['petty_cash'].action_approve()
+        self.env.flush_all()
+        _logger.info(
+            "Generated %d project(s) with %d BOQ lines and %d document lines each (seed %s)",
+            projects, boq_lines, document_lines, seed,
+        )
+        return data
+
+    def _generate_master_data(self, prefix, categories=5, subcategories=4):
+        categories = self.env['h_jubran.master.category'].create([{
+            'name': f'{prefix} Category {index}',
+            'code': f'{prefix}-C{index:02d}',
+        } for index in range(categories)])
+        subcategory_records = self.env['h_jubran.master.subcategory'].create([{
+            'name': f'{prefix} Sub-Category {category.code}.{index}',
+            'code': f'{category.code}-{index:02d}',
+            'category_id': category.id,
+        } for category in categories for index in range(subcategories)])
+        return {'categories': categories, 'subcategories': subcategory_records}
+
+    def _generate_boq(self, data, rng, boq_lines):
+        summaries = self.env['h_jubran.boq.summary'].create([{
+            'name': f'{project.name} BOQ',
+            'project_id': project.id,
+        } for project in data['projects']])
+        vals_list = []
+        for summary in summaries:
+            for index in range(boq_lines):
+                subcategory = rng.choice(data['subcategories'])
+                quantity = rng.randint(1, 500)
+                rate = round(rng.uniform(5.0, 250.0), 2)
+                vals_list.append({
+                    'summary_id': summary.id,
+                    'sequence': index,
+                    'number': str(index + 1),
+                    'code': f'{index + 1:05d}',
+                    'scope': rng.choice(_SCOPES),
+                    'category_id': subcategory.category_id.id,
+                    'subcategory_id': subcategory.id,
+                    'quantity': quantity,
+                    'rate': rate,
+                    'amount': quantity * rate,
+                })
+        self.env['h_jubran.boq.summary.line'].with_context(boq_skip_rebuild=True).create(vals_list)
+        summaries._rebuild_boq_rollups()
+        return summaries
+
+    def _generate_purchase_requests(self, data, rng, keys):
+        return self.env['h_jubran.purchase.request'].create([{
+            'project_id': project.id,
+            'state': 'approved',
+            'line_ids': [fields.Command.create({
+                'name': f'{subcategory.name} {index}',
+                'product_id': data['product'].id,
+                'product_uom_id': data['product'].uom_id.id,
+                'product_qty': rng.randint(1, 50),
+                'rate': round(rng.uniform(5.0, 250.0), 2),
+                'category_id': subcategory.category_id.id,
+                'subcategory_id': subcategory.id,
+            }) for index, subcategory in enumerate(subcategories)],
+        } for project, subcategories in keys.items()])
+
+    def _generate_purchase_orders(self, data, rng, keys):
+        return self.env['purchase.order'].create([{
+            'partner_id': data['partner'].id,
+            'project_id': project.id,
+            'order_line': [fields.Command.create({
+                'name': f'{subcategory.name} {index}',
+                'product_id': data['product'].id,
+                'product_qty': rng.randint(1, 50),
+                'price_unit': round(rng.uniform(5.0, 250.0), 2),
+                'category_id': subcategory.category_id.id,
+                'subcategory_id': subcategory.id,
+            }) for index, subcategory in enumerate(subcategories)],
+        } for project, subcategories in keys.items()])
+
+    def _generate_vendor_bills(self, data, rng, keys):
+        return self.env['account.move'].create([{
+            'move_type': 'in_invoice',
+            'partner_id': data['partner'].id,
+            'project_id': project.id,
+            'invoice_date': fields.Date.to_date('2025-01-31'),
+            'invoice_line_ids': [fields.Command.create({
+                'name': f'{subcategory.name} {index}',
+                'product_id': data['product'].id,
+                'quantity': rng.randint(1, 50),
+                'price_unit': round(rng.uniform(5.0, 250.0), 2),
+                'tax_ids': [fields.Command.clear()],
+                'category_id': subcategory.category_id.id,
+                'subcategory_id': subcategory.id,
+            }) for index, subcategory in enumerate(subcategories)],
+        } for project, subcategories in keys.items()])
+
+    def _generate_petty_cash(self, data, rng, keys):
+        accounts = self.env['account.account']
+        debit_account = accounts.search([('account_type', '=', 'expense')], limit=1)
+        credit_account = accounts.search([('account_type', '=', 'asset_cash')], limit=1)
+        journal = self.env['account.journal'].search([
+            ('type', '=', 'general'), ('company_id', '=', self.env.company.id),
+        ], limit=1)
+        if not (debit_account and credit_account and journal):
+            raise ValueError("Generating petty cash requires a chart of accounts with a miscellaneous journal.")
+        location = self.env['stock.warehouse'].search([
+            ('company_id', '=', self.env.company.id),
+        ], limit=1).lot_stock_id
+        sheets = self.env['h_jubran.petty.cash'].create([{
+            'custodian_id': self.env.uid,
+            'location_id': location.id,
+            'project_id': project.id,
+            'date_from': fields.Date.to_date('2025-01-01'),
+            'date_to': fields.Date.to_date('2025-01-31'),
+        } for project in keys])
+        vals_list = []
+        for sheet, subcategories in zip(sheets, keys.values()):
+            for index, subcategory in enumerate(subcategories):
+                quantity = rng.randint(1, 10)
+                rate = round(rng.uniform(1.0, 50.0), 2)
+                vals_list.append({
+                    'petty_cash_id': sheet.id,
+                    'reference': f'{sheet.name}/{index}',
+                    'debit_account_id': debit_account.id,
+                    'credit_account_id': credit_account.id,
+                    'journal_id': journal.id,
+                    'request_date': fields.Date.to_date('2025-01-15'),
+                    'category_id': subcategory.category_id.id,
+                    'subcategory_id': subcategory.id,
+                    'quantity': quantity,
+                    'rate': rate,
+                    'amount': quantity * rate,
+                })
+        self.env['h_jubran.petty.cash.breakdown'].create(vals_list)
+        return sheets
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+from .perf_data_generator import PerfDataGenerator
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of SQL queries per flow on the data set built in setUpClass,
+# as recorded in query_budgets.json. A flow going over its budget fails the
+# test; a flow without a recorded budget is only measured. Every run logs the
+# budget each flow would get (its count plus QUERY_BUDGET_MARGIN): copy those
+# values into query_budgets.json to record or tighten a budget.
+QUERY_BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+QUERY_BUDGET_MARGIN = 0.1
+
+with open(QUERY_BUDGETS_FILE) as budgets_file:
+    QUERY_BUDGETS = json.load(budgets_file)
+
+
+def _suggested_query_budget(queries):
+    """Budget to record for a flow that ran ``queries`` queries"""
+    return queries + max(5, math.ceil(queries * QUERY_BUDGET_MARGIN))
+
+
+@tagged('post_install', '-at_install', 'h_jubran_perf')
+class TestPerformance(AccountTestInvoicingCommon):
+    """Wall time and SQL query count of the key BOQ and procurement flows
+
+    Run with ``--test-tags h_jubran_perf``; timings are logged at INFO level.
+    """
+
+    projects = 2
+    boq_lines = 200
+    document_lines = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data = PerfDataGenerator(cls.env).generate(
+            projects=cls.projects,
+            boq_lines=cls.boq_lines,
+            document_lines=cls.document_lines,
+            seed=42,
+        )
+        cls.project = cls.data['projects'][0]
+        cls.summary = cls.data['summaries'][0]
+
+    @contextmanager
+    def _benchmark(self, flow):
+        """Time and count the queries of ``flow`` from a cold cache
+
+        Fails when the count exceeds the budget recorded for ``flow``.
+        """
+        self.env.flush_all()
+        self.env.invalidate_all()
+        started = time.perf_counter()
+        queries_before = self.cr.sql_log_count
+        yield
+        self.env.flush_all()
+        queries = self.cr.sql_log_count - queries_before
+        budget = QUERY_BUDGETS.get(flow)
+        _logger.info(
+            "benchmark flow=%s wall_ms=%.1f queries=%d query_budget=%s suggested_budget=%d",
+            flow, (time.perf_counter() - started) * 1000.0, queries, budget,
+            _suggested_query_budget(queries),
+        )
+        if budget is not None:
+            self.assertLessEqual(
+                queries, budget,
+                f"{flow} ran {queries} queries, over its budget of {budget}",
+            )
+
+    def test_boq_line_edit(self):
+        line = self.summary.line_ids[0]
+        with self._benchmark('boq_line_edit'):
+            line.write({'quantity': line.quantity + 1, 'amount': (line.quantity + 1) * line.rate})
+            self.summary._flush_boq_rebuild_queue()
+        self.assertEqual(self.summary.scope_summary_version, self.summary.content_version)
+
+    def test_boq_import(self):
+        subcategories = self.data['subcategories']
+        rows = ['Code,Scope,Sub-Category,Quantity,Rate']
+        rows += [
+            f'IMP{index:05d},Imported Scope {index % 5},{subcategories[index % len(subcategories)].code},{index + 1},12.5'
+            for index in range(self.boq_lines)
+        ]
+        wizard = self.env['h_jubran.boq.import'].create({
+            'summary_id': self.summary.id,
+            'file': base64.b64encode('\n'.join(rows).encode()),
+            'filename': 'boq.csv',
+        })
+        with self._benchmark('boq_import'):
+            wizard.action_import()
+        self.assertEqual(len(self.summary.line_ids), 2 * self.boq_lines)
+
+    def test_purchase_order_confirm(self):
+        order = self.data['orders'][0]
+        with self._benchmark('purchase_order_confirm'):
+            order.button_confirm()
+        self.assertEqual(order.state, 'purchase')
+        entries = self.env['h_jubran.boq.actual.entry'].search([
+            ('source_model', '=', 'purchase.order'), ('source_id', '=', order.id),
+        ])
+        self.assertAlmostEqual(sum(entries.mapped('amount')), order.amount_untaxed, places=2)
+
+    def test_vendor_bill_post(self):
+        bill = self.data['bills'][0]
+        with self._benchmark('vendor_bill_post'):
+            bill.action_post()
+        self.assertEqual(bill.state, 'posted')
+        entries = self.env['h_jubran.boq.actual.entry'].search([
+            ('source_model', '=', 'account.move'), ('source_id', '=', bill.id),
+        ])
+        self.assertAlmostEqual(sum(entries.mapped('amount')), bill.amount_untaxed, places=2)
+
+    def test_pr_to_po_wizard(self):
+        request = self.data['requests'][0]
+        with self._benchmark('pr_to_po_wizard'):
+            wizard = self.env['h_jubran.pr.make.purchase.order'].with_context(
+                active_model='h_jubran.purchase.request.line',
+                active_ids=request.line_ids.ids,
+            ).create({})
+            action = wizard.make_purchase_order()
+        order = self.env['purchase.order'].browse(action['res_id'])
+        self.assertEqual(len(order.order_line), len(request.line_ids))
@@ -2,3 +2,4 @@
 
 from . import h_jubran_pr_make_purchase_order
 
+from . import h_jubran_boq_import
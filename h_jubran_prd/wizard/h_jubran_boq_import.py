@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+import base64
+import csv
+import io
+import json
+import logging
+import time
+from collections import defaultdict
+from itertools import islice
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+_logger = logging.getLogger(__name__)
+
+# Accepted column headers (case-insensitive) for each BOQ line value
+_COLUMNS = {
+    'number': ('number', 'no', 'no.'),
+    'code': ('code', 'boq code'),
+    'scope': ('scope',),
+    'category': ('category', 'category code'),
+    'subcategory': ('subcategory', 'sub-category', 'sub category', 'subcategory code'),
+    'element': ('element', 'element code'),
+    'quantity': ('quantity', 'qty'),
+    'rate': ('rate', 'unit rate'),
+    'amount': ('amount',),
+}
+
+# Columns written by the import on existing lines, with their SQL types
+_UPDATE_COLUMNS = {
+    'number': 'varchar',
+    'scope': 'varchar',
+    'category_id': 'int',
+    'subcategory_id': 'int',
+    'element_id': 'int',
+    'quantity': 'numeric',
+    'rate': 'numeric',
+    'amount': 'numeric',
+}
+
+
+class HjubranBoqImport(models.TransientModel):
+    _name = 'h_jubran.boq.import'
+    _description = 'Import BOQ Summary Lines'
+
+    summary_id = fields.Many2one(
+        'h_jubran.boq.summary',
+        string='BOQ Summary',
+        required=True,
+        ondelete='cascade'
+    )
+    file = fields.Binary(string='File', required=True)
+    filename = fields.Char(string='File Name')
+    batch_size = fields.Integer(
+        string='Batch Size',
+        default=1000,
+        help="Number of lines inserted per batch."
+    )
+
+    def action_import(self):
+        """Import the file in batches and rebuild the BOQ rollups once at the end
+
+        All rows are parsed and checked first, so a file with an unknown or
+        duplicated code is rejected before anything is written. New codes
+        are created in batches of ``batch_size`` lines, existing ones updated
+        with one UPDATE per batch (see ``_update_lines``).
+        """
+        self.ensure_one()
+        if self.batch_size <= 0:
+            raise UserError(_("The batch size must be positive."))
+        started = time.monotonic()
+        lookups = self._load_lookups()
+        line_model = self.env['h_jubran.boq.summary.line'].with_context(boq_skip_rebuild=True)
+        existing = dict(self.env['h_jubran.boq.summary.line']._read_group(
+            [('summary_id', '=', self.summary_id.id)], ['code'], ['id:min'],
+        ))
+
+        vals_list = []
+        rows_by_code = defaultdict(list)
+        for row_number, row in self._read_rows():
+            vals = self._prepare_line_vals(row, lookups, row_number)
+            rows_by_code[vals['code']].append(row_number)
+            vals_list.append(vals)
+        duplicates = {code: rows for code, rows in rows_by_code.items() if len(rows) > 1}
+        if duplicates:
+            raise UserError(_(
+                "Codes must be unique per BOQ summary, the file repeats:\n%s",
+                '\n'.join(
+                    _("%(code)s on rows %(rows)s", code=code, rows=', '.join(map(str, rows)))
+                    for code, rows in islice(duplicates.items(), 20)
+                ),
+            ))
+
+        to_create = [vals for vals in vals_list if vals['code'] not in existing]
+        to_update = [dict(vals, id=existing[vals['code']]) for vals in vals_list if vals['code'] in existing]
+        for start in range(0, len(to_create), self.batch_size):
+            line_model.create(to_create[start:start + self.batch_size])
+            _logger.info(
+                "BOQ import into %s: %d of %d lines created",
+                self.summary_id.display_name, min(start + self.batch_size, len(to_create)), len(to_create),
+            )
+        for start in range(0, len(to_update), self.batch_size):
+            self._update_lines(to_update[start:start + self.batch_size])
+            _logger.info(
+                "BOQ import into %s: %d of %d lines updated",
+                self.summary_id.display_name, min(start + self.batch_size, len(to_update)), len(to_update),
+            )
+
+        self.summary_id._rebuild_boq_rollups()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Import Completed'),
+                'message': _(
+                    '%(created)s lines created and %(updated)s updated in %(seconds).1f seconds.',
+                    created=len(to_create), updated=len(to_update), seconds=time.monotonic() - started,
+                ),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+    def _update_lines(self, vals_list):
+        """Write the file values of existing lines with a single UPDATE
+
+        ``vals_list`` holds the values of ``_prepare_line_vals`` plus the
+        line ``id``. The rows are sent as one JSON array joined to the table,
+        then the ORM is told what changed: the cache is dropped, dependent
+        stored fields (scope key, summary totals) are marked to recompute,
+        the constraints are checked and the projects' BOQ rates invalidated.
+        The rollups are rebuilt by the caller, as for created lines.
+        """
+        line_model = self.env['h_jubran.boq.summary.line']
+        fnames = list(_UPDATE_COLUMNS)
+        line_model.flush_model(fnames)
+        rows = [
+            {'id': vals['id'], **{fname: None if vals[fname] is False else vals[fname] for fname in fnames}}
+            for vals in vals_list
+        ]
+        self.env.cr.execute(f"""
+            UPDATE h_jubran_boq_summary_line l
+               SET {', '.join(f'{fname} = v.{fname}' for fname in fnames)},
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM jsonb_to_recordset(%s::jsonb) AS v({', '.join(f'{fname} {sql_type}' for fname, sql_type in _UPDATE_COLUMNS.items())}, id int)
+             WHERE l.id = v.id
+        """, (self.env.uid, json.dumps(rows)))
+        lines = line_model.browse([vals['id'] for vals in vals_list])
+        lines.invalidate_recordset(fnames + ['write_uid', 'write_date'])
+        lines.modified(fnames)
+        lines._validate_fields(fnames)
+        line_model._bump_boq_rate_version(lines.summary_id.project_id)
+
+    def _load_lookups(self):
+        """Load the master data codes once, as {code: record values} dicts"""
+        categories = {
+            rec['code']: rec['id']
+            for rec in self.env['h_jubran.master.category'].search_read([('code', '!=', False)], ['code'])
+        }
+        subcategories = {
+            rec['code']: (rec['id'], rec['category_id'][0])
+            for rec in self.env['h_jubran.master.subcategory'].search_read(
+                [('code', '!=', False)], ['code', 'category_id'])
+        }
+        elements = {
+            rec['code']: (rec['id'], rec['subcategory_id'][0], rec['category_id'] and rec['category_id'][0])
+            for rec in self.env['h_jubran.master.element'].search_read(
+                [], ['code', 'subcategory_id', 'category_id'])
+        }
+        return categories, subcategories, elements
+
+    def _read_rows(self):
+        """Yield ``(row_number, {column: value})`` per data row of the uploaded file
+
+        ``row_number`` is the row number in the sheet (the header is row 1),
+        blank rows included, so errors point at the row the user sees.
+        """
+        content = base64.b64decode(self.file)
+        filename = (self.filename or '').lower()
+        if filename.endswith('.xlsx'):
+            if openpyxl is None:
+                raise UserError(_("Reading XLSX files requires the openpyxl Python library."))
+            sheet = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True).active
+            rows = sheet.iter_rows(min_row=1, values_only=True)
+        elif filename.endswith('.csv'):
+            rows = csv.reader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig'))
+        else:
+            raise UserError(_("Please upload a CSV or XLSX file."))
+
+        header = next(rows, None)
+        if not header:
+            return
+        aliases = {alias: column for column, names in _COLUMNS.items() for alias in names}
+        columns = [aliases.get(str(title or '').strip().lower()) for title in header]
+        if 'code' not in columns or 'scope' not in columns:
+            raise UserError(_("The file must have at least a Code and a Scope column."))
+        for row_number, row in enumerate(rows, start=2):
+            values = {
+                column: _cell_to_str(value)
+                for column, value in zip(columns, row)
+                if column
+            }
+            if any(values.values()):
+                yield row_number, values
+
+    def _prepare_line_vals(self, row, lookups, row_number):
+        """Resolve the codes of a file row into BOQ line values"""
+        categories, subcategories, elements = lookups
+        if not row.get('code'):
+            raise UserError(_("Row %s: the Code column is empty.", row_number))
+        vals = {
+            'summary_id': self.summary_id.id,
+            'number': row.get('number') or False,
+            'code': row['code'],
+            'scope': row.get('scope') or '',
+        }
+        category_id = subcategory_id = element_id = False
+        if row.get('category'):
+            category_id = categories.get(row['category'])
+            if not category_id:
+                raise UserError(_("Row %(row)s: unknown category code %(code)s.", row=row_number, code=row['category']))
+        if row.get('subcategory'):
+            if row['subcategory'] not in subcategories:
+                raise UserError(_("Row %(row)s: unknown sub-category code %(code)s.", row=row_number, code=row['subcategory']))
+            subcategory_id, category_id = subcategories[row['subcategory']]
+        if row.get('element'):
+            if row['element'] not in elements:
+                raise UserError(_("Row %(row)s: unknown element code %(code)s.", row=row_number, code=row['element']))
+            element_id, subcategory_id, category_id = elements[row['element']]
+        vals.update({
+            'category_id': category_id,
+            'subcategory_id': subcategory_id,
+            'element_id': element_id,
+        })
+
+        try:
+            quantity = float(row.get('quantity') or 0.0)
+            rate = float(row.get('rate') or 0.0)
+            amount = float(row['amount']) if row.get('amount') else quantity * rate
+        except ValueError:
+            raise UserError(_("Row %s: quantity, rate and amount must be numbers.", row_number))
+        vals.update({'quantity': quantity, 'rate': rate, 'amount': amount})
+        return vals
+
+
+def _cell_to_str(value):
+    """Return a stripped string for a CSV/XLSX cell (``12.0`` becomes ``12``)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
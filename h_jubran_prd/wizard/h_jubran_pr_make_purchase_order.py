@@ -44,29 +44,30 @@ class HjubranPrMakePurchaseOrder(models.TransientModel):
         
         # Group lines by vendor/partner
         partner_lines = {}
+        default_partner = None
         for item in self.item_ids:
             pr_line = item.line_id
             # Get vendor from product or use default
-            partner = False
             if pr_line.product_id and pr_line.product_id.seller_ids:
                 partner = pr_line.product_id.seller_ids[0].partner_id
             else:
-                # Use company partner or first vendor
-                partner = self.env['res.partner'].search([('supplier_rank', '>', 0)], limit=1)
+                # Use the first vendor, searched once for all the lines
+                if default_partner is None:
+                    default_partner = self.env['res.partner'].search([('supplier_rank', '>', 0)], limit=1)
+                partner = default_partner
             
             if not partner:
                 raise UserError(_("No vendor found for line: %s") % (pr_line.name or 'Untitled'))
             
-            partner_id = partner.id
-            if partner_id not in partner_lines:
-                partner_lines[partner_id] = []
-            partner_lines[partner_id].append(item)
+            partner_lines.setdefault(partner.id, []).append(item)
         
-        # Create purchase orders
+        # Create purchase orders, without per-line tracking noise
+        picking_type = self._get_picking_type()
+        wizard = self.with_context(mail_notrack=True, tracking_disable=True)
         purchase_orders = self.env['purchase.order']
         for partner_id, items in partner_lines.items():
-            po = self._create_purchase_order(partner_id, items)
-            purchase_orders |= po
+            purchase_orders |= wizard._create_purchase_order(partner_id, items, picking_type)
+        self._post_purchase_order_messages(purchase_orders)
         
         # Return action to view created POs
         if len(purchase_orders) == 1:
@@ -86,12 +87,8 @@ class HjubranPrMakePurchaseOrder(models.TransientModel):
                 'target': 'current',
             }
 
-    def _create_purchase_order(self, partner_id, items):
-        """Create a purchase order for a partner"""
-        partner = self.env['res.partner'].browse(partner_id)
-        pr = items[0].line_id.request_id
-        
-        # Get picking type
+    def _get_picking_type(self):
+        """Return the incoming picking type used for the purchase orders"""
         picking_type = self.env['stock.picking.type'].search([
             ('code', '=', 'incoming'),
             ('warehouse_id.company_id', '=', self.env.company.id)
@@ -100,6 +97,11 @@ class HjubranPrMakePurchaseOrder(models.TransientModel):
             picking_type = self.env['stock.picking.type'].search([
                 ('code', '=', 'incoming')
             ], limit=1)
+        return picking_type
+
+    def _create_purchase_order(self, partner_id, items, picking_type):
+        """Create a purchase order for a partner"""
+        pr = items[0].line_id.request_id
         
         # Create PO
         po_vals = {
@@ -117,21 +119,31 @@ class HjubranPrMakePurchaseOrder(models.TransientModel):
         
         po = self.env['purchase.order'].create(po_vals)
         
-        # Create PO lines
-        for item in items:
-            pr_line = item.line_id
-            line_vals = self._prepare_po_line(po, item, pr_line)
-            po_line = self.env['purchase.order.line'].create(line_vals)
-            
-            # Link PR line to PO line
-            pr_line.purchase_lines = [(4, po_line.id)]
+        # Create all the PO lines at once, each linked to its PR line
+        self.env['purchase.order.line'].create([
+            self._prepare_po_line(po, item, item.line_id)
+            for item in items
+        ])
         
         return po
 
+    def _post_purchase_order_messages(self, purchase_orders):
+        """Post a single summary message on each purchase request"""
+        lines_by_request = {}
+        for item in self.item_ids:
+            lines_by_request.setdefault(item.line_id.request_id, []).append(item.line_id)
+        for request, lines in lines_by_request.items():
+            orders = purchase_orders.filtered(
+                lambda po: set(po.order_line.purchase_lines.ids) & {line.id for line in lines}
+            )
+            request.message_post(body=_(
+                "%(count)s line(s) ordered in Purchase Order(s) %(orders)s.",
+                count=len(lines),
+                orders=", ".join(orders.mapped('name')),
+            ))
+
     def _prepare_po_line(self, po, item, pr_line):
         """Prepare purchase order line values"""
-        from odoo.tools import get_lang
-        
         qty = item.product_qty
         if item.product_uom_id:
             qty = item.product_uom_id._compute_quantity(qty, item.product_uom_id)
@@ -144,6 +156,8 @@ class HjubranPrMakePurchaseOrder(models.TransientModel):
             'price_unit': pr_line.rate if pr_line.rate else 0.0,
             'name': item.name or pr_line.name or '',
             'date_planned': datetime.now(),
+            # Link PR line to PO line
+            'purchase_lines': [(4, pr_line.id)],
         }
         
         # Copy custom fields from PR line